@@ -2,8 +2,16 @@ import csv
 import copy
 from collections import defaultdict
 from tabulate import tabulate
+import evaluation
+import export
+from constraints import ConstraintSet, default_constraints
+import constraints as constraint_registry
 import re
 import math
+import os
+import argparse
+import sys
+import profiling
 
 # Data Structures
 class Auditorium:
@@ -82,11 +90,15 @@ def read_subjects(filename):
             ))
     return subjects
 
-# Loading data
-auditoriums = read_auditoriums('auditoriums.csv')
-groups = read_groups('groups.csv')
-lecturers = read_lecturers('lecturers.csv')
-subjects = read_subjects('subjects.csv')
+# Директорія з вхідними CSV-файлами (за замовчуванням - поруч зі скриптом)
+DATA_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def load_data(data_dir=DATA_DIR):
+    auditoriums = read_auditoriums(os.path.join(data_dir, 'auditoriums.csv'))
+    groups = read_groups(os.path.join(data_dir, 'groups.csv'))
+    lecturers = read_lecturers(os.path.join(data_dir, 'lecturers.csv'))
+    subjects = read_subjects(os.path.join(data_dir, 'subjects.csv'))
+    return auditoriums, groups, lecturers, subjects
 
 # Define time slots: 5 days, 4 periods per day
 DAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday']
@@ -127,70 +139,26 @@ def generate_lessons(subjects, groups):
                 lesson_id += 1
     return lessons
 
-# Generate all lessons
-lessons = generate_lessons(subjects, groups)
+PROGRESS_INTERVAL = 100  # Як часто (у вузлах пошуку) повідомляти про прогрес
 
 # Define CSP Variables and Domains
 class CSP:
-    def __init__(self, variables, domains, lecturers, auditoriums):
+    def __init__(self, variables, domains, lecturers, auditoriums, constraints=None):
         self.variables = variables  # List of Lesson objects
+        self.lessons_by_id = {lesson.id: lesson for lesson in variables}
         self.domains = domains      # Dict: lesson_id -> list of possible assignments (day, period, aud, lect)
         self.lecturers = lecturers
         self.auditoriums = auditoriums
+        self.nodes = 0  # Кількість вузлів дерева пошуку, відвіданих backtrack
+        self.on_progress = None  # Необов'язковий виклик on_progress(nodes, assigned) кожні PROGRESS_INTERVAL вузлів
+        # Активні жорсткі обмеження (див. constraints.py); за замовчуванням - обмеження 1-7
+        self.constraints = constraints if constraints is not None else default_constraints()
+        self.constraint_set = None
 
     def is_consistent(self, assignment, var, value, week_number):
-        day, period, aud, lect = value
-        # Жорсткі обмеження
-        for other_var_id, other_value in assignment.items():
-            other_day, other_period, other_aud, other_lect = other_value
-            # Перевірка на той же час
-            if day == other_day and period == other_period:
-                # 1. Одна аудиторія одночасно
-                if aud == other_aud:
-                    return False
-                # 2. Один викладач одночасно
-                if lect == other_lect:
-                    return False
-                # 3. Одна група одночасно
-                if self.variables[var].group.number == self.variables[other_var_id].group.number:
-                    # Перевірка підгруп
-                    if self.variables[var].subgroup and self.variables[other_var_id].subgroup:
-                        if self.variables[var].subgroup == self.variables[other_var_id].subgroup:
-                            return False
-                    else:
-                        return False
-
-        # 4. Аудиторія має достатню місткість
-        group_size = self.variables[var].group.size
-        if self.variables[var].subgroup and self.variables[var].group.subgroups:
-            group_size = math.ceil(group_size / len(self.variables[var].group.subgroups))
-        auditorium = next((a for a in self.auditoriums if a.id == aud), None)
-        if auditorium and auditorium.capacity < group_size:
-            return False
-
-        # 5. Викладач не перевищує максимальну кількість годин
-        hours_assigned = sum(1 for v, val in assignment.items() if val[3] == lect)
-        lecturer = next((l for l in self.lecturers if l.id == lect), None)
-        if lecturer and hours_assigned >= lecturer.max_hours_per_week:
-            return False
-
-        # 6. Обмеження за типом тижня (week_type)
-        subject_week_type = self.variables[var].subject.week_type
-        if subject_week_type == 'even' and week_number % 2 != 0:
-            return False
-        if subject_week_type == 'odd' and week_number % 2 != 1:
-            return False
-        # 'both' тижні вже дозволені
-
-        # 7. Специфічні обмеження (наприклад, максимум занять викладача в день)
-        # Можна додати тут перевірку на кількість занять викладача в конкретний день
-        max_lecturer_daily_hours = 3  # Приклад: максимум 3 години на день
-        daily_hours = sum(1 for v, val in assignment.items()
-                          if val[3] == lect and val[0] == day)
-        if daily_hours >= max_lecturer_daily_hours:
-            return False
-
-        return True
+        # Жорсткі обмеження перевіряє скомпільований набір ConstraintSet:
+        # кожне обмеження тримає власний індекс поточного присвоєння, тож перевірка не переглядає assignment
+        return self.constraint_set.check(self.lessons_by_id[var], value)
 
     def select_unassigned_variable(self, assignment):
         # Використовуємо MRV (Minimum Remaining Values) евристику
@@ -237,9 +205,9 @@ class CSP:
                     if day == other_day and period == other_period:
                         if aud == other_aud or lect == other_lect:
                             conflicts += 1
-                        if self.variables[var.id].group.number == other_var.group.number:
-                            if self.variables[var.id].subgroup and other_var.subgroup:
-                                if self.variables[var.id].subgroup == other_var.subgroup:
+                        if var.group.number == other_var.group.number:
+                            if var.subgroup and other_var.subgroup:
+                                if var.subgroup == other_var.subgroup:
                                     conflicts += 1
                             else:
                                 conflicts += 1
@@ -248,6 +216,9 @@ class CSP:
         return sorted(self.domains[var.id], key=lambda value: count_conflicts(value))
 
     def backtrack(self, assignment, week_number):
+        self.nodes += 1
+        if self.on_progress and self.nodes % PROGRESS_INTERVAL == 0:
+            self.on_progress(self.nodes, len(assignment))
         # Якщо всі змінні присвоєні, повертаємо присвоєння
         if len(assignment) == len(self.variables):
             return assignment
@@ -261,22 +232,34 @@ class CSP:
         for value in ordered_values:
             if self.is_consistent(assignment, var.id, value, week_number):
                 assignment[var.id] = value
+                self.constraint_set.assign(var, value)
                 result = self.backtrack(assignment, week_number)
                 if result:
                     return result
+                self.constraint_set.unassign(var, value)
                 del assignment[var.id]
         return None
 
-    def solve(self):
-        # Припустимо, що ми створюємо розклад на один тиждень
-        # Для розкладу на декілька тижнів необхідно адаптувати алгоритм
-        week_number = 1  # Починаємо з першого тижня
-        return self.backtrack({}, week_number)
+    def solve(self, week_number=1, initial=None):
+        # Розклад на один тиждень семестру (за замовчуванням перший); семестр цілком - horizon.py.
+        # initial - часткове присвоєння для теплого старту, наприклад розв'язок схожого тижня:
+        # значення поза доменом або ті, що порушують обмеження, відкидаються, решта фіксується
+        self.constraint_set = ConstraintSet(self.constraints, self, week_number)
+        assignment = {}
+        for lesson in self.variables:
+            value = initial.get(lesson.id) if initial else None
+            if value in self.domains.get(lesson.id, ()) and self.is_consistent(assignment, lesson.id, value, week_number):
+                assignment[lesson.id] = value
+                self.constraint_set.assign(lesson, value)
+        return self.backtrack(assignment, week_number)
 
 # Function to create domains for each lesson
-def create_domains(lessons, lecturers, auditoriums):
+def create_domains(lessons, lecturers, auditoriums, on_lesson=None):
+    # on_lesson() - необов'язковий виклик перед побудовою домену кожного заняття, наприклад перевірка бюджету пам'яті
     domains = {}
     for lesson in lessons:
+        if on_lesson:
+            on_lesson()
         possible_values = []
         # Фільтруємо можливих викладачів
         possible_lecturers = [lect for lect in lecturers if
@@ -303,28 +286,11 @@ def create_domains(lessons, lecturers, auditoriums):
     return domains
 
 # Function to calculate fitness based on soft constraints
-def calculate_fitness(schedule_even, schedule_odd, groups):
-    fitness = 0
-    # Мінімізація кількості вікон (перерв) у розкладі для кожної групи
-    for group in groups:
-        for week, schedule in [('even', schedule_even), ('odd', schedule_odd)]:
-            daily_schedule = {day: [] for day in DAYS}
-            for key, entries in schedule.items():
-                day, period = key
-                for entry in entries:
-                    if entry['Group'] == group.number or (group.subgroups and any(entry['Group'] == f"{group.number} (Підгрупа {sg})" for sg in group.subgroups)):
-                        daily_schedule[day].append(int(period))
-            # Рахуємо кількість вікон
-            for day, periods in daily_schedule.items():
-                if not periods:
-                    continue
-                periods = sorted(periods)
-                windows = 0
-                for i in range(1, len(periods)):
-                    if periods[i] - periods[i-1] > 1:
-                        windows += 1
-                fitness += windows
-    return fitness
+def calculate_fitness(solution, lessons, groups, lecturers):
+    # Мінімізація кількості вікон (перерв) у розкладі для кожної групи та підгрупи;
+    # рахується спільним з генетичним алгоритмом оцінювачем (evaluation.py)
+    evaluator = evaluation.Evaluator(groups, lecturers, DAYS, PERIODS)
+    return evaluator.evaluate(evaluation.placements_from_csp(solution, lessons))['windows']
 
 # Function to enforce constraints related to lecturers' maximum hours per week
 def enforce_lecturer_max_hours(assignment, lecturers, lesson_id, value):
@@ -335,30 +301,22 @@ def enforce_lecturer_max_hours(assignment, lecturers, lesson_id, value):
         return False
     return True
 
-# Generate domains
-domains = create_domains(lessons, lecturers, auditoriums)
-
-# Initialize CSP
-csp = CSP(variables=lessons, domains=domains, lecturers=lecturers, auditoriums=auditoriums)
-
-# Solve CSP
-solution = csp.solve()
-
-if not solution:
-    print("Не вдалося знайти розклад, який задовольняє всі жорсткі обмеження.")
-else:
-    # Організуємо розклад для друку
+# Function to organize a solution into even and odd week schedules
+def build_schedules(solution, lessons, lecturers, auditoriums):
     schedule_even = defaultdict(list)
     schedule_odd = defaultdict(list)
+    lessons_by_id = {lesson.id: lesson for lesson in lessons}
+    lecturers_by_id = {lecturer.id: lecturer for lecturer in lecturers}
+    auditoriums_by_id = {auditorium.id: auditorium for auditorium in auditoriums}
 
     for lesson_id, (day, period, aud, lect_id) in solution.items():
-        lesson = next((s for s in lessons if s.id == lesson_id), None)
+        lesson = lessons_by_id.get(lesson_id)
         if not lesson:
             continue
         # Визначаємо тип тижня
         week_type = lesson.subject.week_type
-        lecturer = next((l for l in lecturers if l.id == lect_id), None)
-        auditorium = next((a for a in auditoriums if a.id == aud), None)
+        lecturer = lecturers_by_id.get(lect_id)
+        auditorium = auditoriums_by_id.get(aud)
         entry = {
             'Timeslot': f"{day}, період {period}",
             'Group': f"{lesson.group.number}" + (f" (Підгрупа {lesson.subgroup})" if lesson.subgroup else ""),
@@ -376,34 +334,91 @@ else:
             schedule_even[(day, period)].append(entry)
         elif week_type == 'odd':
             schedule_odd[(day, period)].append(entry)
-
-    # Розрахунок фітнесу
-    fitness = calculate_fitness(schedule_even, schedule_odd, groups)
-
-    # Функція для друку розкладу
-    def print_schedule(even, odd):
-        headers = ['Timeslot', 'Group', 'Subject', 'Type', 'Lecturer', 'Auditorium', 'Students', 'Capacity']
-        even_table = []
-        odd_table = []
-        for time_slot in sorted(even.keys(), key=lambda x: (DAYS.index(x[0]), int(x[1]))):
-            for entry in even[time_slot]:
-                row = [entry[h] for h in headers]
-                even_table.append(row)
-        for time_slot in sorted(odd.keys(), key=lambda x: (DAYS.index(x[0]), int(x[1]))):
-            for entry in odd[time_slot]:
-                row = [entry[h] for h in headers]
-                odd_table.append(row)
-        print("\nРозклад - Парний тиждень:\n")
-        if even_table:
-            print(tabulate(even_table, headers=headers, tablefmt="grid", stralign="center"))
-        else:
-            print("Немає занять для парного тижня.\n")
-        print("\nРозклад - Непарний тиждень:\n")
-        if odd_table:
-            print(tabulate(odd_table, headers=headers, tablefmt="grid", stralign="center"))
-        else:
-            print("Немає занять для непарного тижня.\n")
-
-    # Друк розкладу та фітнесу
-    print_schedule(schedule_even, schedule_odd)
-    print(f"\nФітнес розкладу: {fitness} вікон")
+    return schedule_even, schedule_odd
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='CSP timetable scheduler')
+    parser.add_argument('--data-dir', default=DATA_DIR, help='directory with the input CSV files')
+    parser.add_argument('--constraint', type=constraint_registry.parse_spec, action='append', default=[],
+                        metavar='NAME[:JSON]', help='hard constraint from constraints.py, e.g. '
+                        'group_daily_lessons:\'{"limit": 3}\'; replaces the default one of the same name; '
+                        'may be repeated')
+    export.add_arguments(parser)
+    profiling.add_arguments(parser)
+    args = parser.parse_args()
+    export.check_arguments(parser, args)
+    # Необов'язковий профіль пам'яті за фазами та бюджет пам'яті (--profile-memory, --memory-budget)
+    profile = profiling.from_args(args)
+
+    try:
+        # Loading data
+        with profile.phase('load'):
+            auditoriums, groups, lecturers, subjects = load_data(args.data_dir)
+
+        with profile.phase('domain build'):
+            # Generate all lessons
+            lessons = generate_lessons(subjects, groups)
+
+            # Generate domains
+            domains = create_domains(lessons, lecturers, auditoriums,
+                                     on_lesson=profile.check if args.memory_budget is not None else None)
+            profile.check()
+
+        with profile.phase('search'):
+            # Initialize CSP
+            csp = CSP(variables=lessons, domains=domains, lecturers=lecturers, auditoriums=auditoriums,
+                      constraints=default_constraints(args.constraint))
+            if args.memory_budget is not None:
+                # Бюджет перевіряється кожні PROGRESS_INTERVAL вузлів пошуку
+                csp.on_progress = lambda nodes, assigned: profile.check()
+
+            # Solve CSP
+            solution = csp.solve()
+    except profiling.MemoryBudgetExceeded as e:
+        # Пошук зупиняється без трасування, з профілем пам'яті до моменту зупинки
+        print(f"Пошук зупинено: {e}", file=sys.stderr)
+        profile.report()
+        sys.exit(3)
+
+    if not solution:
+        print("Не вдалося знайти розклад, який задовольняє всі жорсткі обмеження.")
+    elif args.export:
+        # Потоковий експорт замість друку таблиць
+        with profile.phase('render'):
+            export.export(export.placements_from_csp(solution, lessons, lecturers, auditoriums),
+                          args.export, args.output, args.view, args.term_start)
+    else:
+        # Розрахунок фітнесу
+        with profile.phase('evaluation'):
+            fitness = calculate_fitness(solution, lessons, groups, lecturers)
+
+        # Функція для друку розкладу
+        def print_schedule(even, odd):
+            headers = ['Timeslot', 'Group', 'Subject', 'Type', 'Lecturer', 'Auditorium', 'Students', 'Capacity']
+            even_table = []
+            odd_table = []
+            for time_slot in sorted(even.keys(), key=lambda x: (DAYS.index(x[0]), int(x[1]))):
+                for entry in even[time_slot]:
+                    row = [entry[h] for h in headers]
+                    even_table.append(row)
+            for time_slot in sorted(odd.keys(), key=lambda x: (DAYS.index(x[0]), int(x[1]))):
+                for entry in odd[time_slot]:
+                    row = [entry[h] for h in headers]
+                    odd_table.append(row)
+            print("\nРозклад - Парний тиждень:\n")
+            if even_table:
+                print(tabulate(even_table, headers=headers, tablefmt="grid", stralign="center"))
+            else:
+                print("Немає занять для парного тижня.\n")
+            print("\nРозклад - Непарний тиждень:\n")
+            if odd_table:
+                print(tabulate(odd_table, headers=headers, tablefmt="grid", stralign="center"))
+            else:
+                print("Немає занять для непарного тижня.\n")
+
+        # Організуємо розклад для друку; друк розкладу та фітнесу
+        with profile.phase('render'):
+            schedule_even, schedule_odd = build_schedules(solution, lessons, lecturers, auditoriums)
+            print_schedule(schedule_even, schedule_odd)
+        print(f"\nФітнес розкладу: {fitness} вікон")
+    profile.report()
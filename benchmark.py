@@ -0,0 +1,197 @@
+import csv
+import os
+import io
+import sys
+import time
+import random
+import argparse
+import tempfile
+import tracemalloc
+import contextlib
+import multiprocessing
+from queue import Empty
+from tabulate import tabulate
+
+import instance_generator
+import profiling
+
+# Scaling benchmark for both solvers on generated instances.
+# Every run happens in a fresh process, so peak memory belongs to that run only
+# and a solver that hangs or crashes is stopped without losing the other results.
+
+RESULT_FIELDS = ['solver', 'groups', 'seed', 'room_slack', 'lecturer_slack', 'lessons', 'status',
+                 'wall_time', 'peak_memory_mb', 'nodes', 'generations', 'fitness_evaluations', 'fitness']
+POLL_INTERVAL = 0.5  # Seconds between checks that a solver process is still alive
+
+
+def _run_csp(data_dir, settings):
+    import CSP
+    auditoriums, groups, lecturers, subjects = CSP.load_data(data_dir)
+    lessons = CSP.generate_lessons(subjects, groups)
+    domains = CSP.create_domains(lessons, lecturers, auditoriums)
+    csp = CSP.CSP(variables=lessons, domains=domains, lecturers=lecturers, auditoriums=auditoriums)
+    solution = csp.solve()
+    result = {'lessons': len(lessons), 'nodes': csp.nodes}
+    if not solution:
+        result['status'] = 'no solution'
+        return result
+    result['status'] = 'ok'
+    result['fitness'] = CSP.calculate_fitness(solution, lessons, groups, lecturers)  # windows, lower is better
+    return result
+
+
+def _run_ga(data_dir, settings):
+    import test_lab
+    test_lab.load_data(data_dir)
+    test_lab.POPULATION_SIZE = settings['population']
+    test_lab.GENERATIONS = settings['generations']
+    evaluations_before = test_lab.fitness_evaluations
+    best_schedule = test_lab.genetic_algorithm(seed_rate=settings['seed_rate'], memetic=settings['memetic'])
+    return {
+        'lessons': len(test_lab.instance.lesson_templates),
+        'status': 'ok',
+        'generations': test_lab.generations_run,
+        'fitness_evaluations': test_lab.fitness_evaluations - evaluations_before,
+        'fitness': best_schedule.fitness  # 1 / (1 + penalty), higher is better
+    }
+
+
+SOLVERS = {'csp': _run_csp, 'ga': _run_ga}
+
+
+def _worker(solver, data_dir, settings, queue):
+    if profiling.resource is None:
+        tracemalloc.start()  # Peak memory falls back to the tracemalloc peak
+    random.seed(settings['seed'])
+    start = time.perf_counter()
+    try:
+        # Solvers print progress and timetables; keep the benchmark output readable
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = SOLVERS[solver](data_dir, settings)
+    except Exception as e:
+        result = {'status': f"error: {type(e).__name__}"}
+    result['wall_time'] = time.perf_counter() - start
+    result['peak_memory_mb'] = profiling.peak_rss_mb()
+    queue.put(result)
+
+
+def run_one(solver, data_dir, settings, timeout):
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=_worker, args=(solver, data_dir, settings, queue))
+    start = time.perf_counter()
+    process.start()
+    # Poll instead of waiting the whole timeout, so a run that dies is reported as soon as it does
+    result = None
+    while result is None:
+        try:
+            result = queue.get(timeout=POLL_INTERVAL)
+        except Empty:
+            elapsed = time.perf_counter() - start
+            if not process.is_alive():
+                try:
+                    # The result may still be in flight from a process that has just exited
+                    result = queue.get(timeout=POLL_INTERVAL)
+                except Empty:
+                    # Killed (e.g. out of memory or stack overflow) before reporting
+                    result = {'status': f"crashed ({process.exitcode})", 'wall_time': elapsed}
+            elif elapsed >= timeout:
+                result = {'status': 'timeout', 'wall_time': elapsed}
+    process.join(5)
+    if process.is_alive():
+        process.terminate()
+        process.join()
+    return result
+
+
+def run_benchmark(group_counts, solvers, seed=0, room_slack=0.5, lecturer_slack=0.5, timeout=300,
+                  data_root=None, settings=None):
+    settings = dict(settings or {}, seed=seed)
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_root = data_root or tmp_dir
+        for num_groups in group_counts:
+            data_dir = os.path.join(data_root, f"groups_{num_groups}_seed_{seed}")
+            instance_generator.write_instance(data_dir, num_groups, seed, room_slack, lecturer_slack)
+            for solver in solvers:
+                result = {'solver': solver, 'groups': num_groups, 'seed': seed,
+                          'room_slack': room_slack, 'lecturer_slack': lecturer_slack}
+                result.update(run_one(solver, data_dir, settings, timeout))
+                results.append(result)
+                print(f"{solver} / {num_groups} groups: {result['status']} in {result['wall_time']:.2f}s",
+                      file=sys.stderr)
+    return results
+
+
+def write_results(results, filename):
+    with open(filename, 'w', newline='', encoding='utf-8') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=RESULT_FIELDS, delimiter=';')
+        writer.writeheader()
+        for result in results:
+            writer.writerow({field: result.get(field, '') for field in RESULT_FIELDS})
+
+
+def read_results(filename):
+    with open(filename, newline='', encoding='utf-8') as csvfile:
+        return list(csv.DictReader(csvfile, delimiter=';'))
+
+
+def find_regressions(results, baseline, tolerance):
+    # Runs that got slower than baseline * (1 + tolerance) or stopped succeeding
+    regressions = []
+    previous = {(row['solver'], int(row['groups'])): row for row in baseline}
+    for result in results:
+        old = previous.get((result['solver'], result['groups']))
+        if not old:
+            continue
+        if old['status'] == 'ok' and result['status'] != 'ok':
+            regressions.append(f"{result['solver']} / {result['groups']} groups: "
+                               f"status {old['status']} -> {result['status']}")
+        elif result['status'] == 'ok' and result['wall_time'] > float(old['wall_time']) * (1 + tolerance):
+            regressions.append(f"{result['solver']} / {result['groups']} groups: "
+                               f"{float(old['wall_time']):.2f}s -> {result['wall_time']:.2f}s")
+    return regressions
+
+
+def print_results(results):
+    table = []
+    for result in results:
+        row = []
+        for field in RESULT_FIELDS:
+            value = result.get(field, '')
+            row.append(f"{value:.3f}" if isinstance(value, float) else value)
+        table.append(row)
+    print(tabulate(table, headers=RESULT_FIELDS, tablefmt="grid", stralign="center"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Scaling benchmark of the CSP and GA schedulers')
+    parser.add_argument('--groups', type=int, nargs='+', default=[10, 20, 50], help='instance sizes to run')
+    parser.add_argument('--solvers', nargs='+', choices=sorted(SOLVERS), default=sorted(SOLVERS))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--room-slack', type=float, default=0.5)
+    parser.add_argument('--lecturer-slack', type=float, default=0.5)
+    parser.add_argument('--timeout', type=float, default=300, help='seconds per solver run')
+    parser.add_argument('--population', type=int, default=50, help='GA population size')
+    parser.add_argument('--generations', type=int, default=100, help='GA generations')
+    parser.add_argument('--seed-rate', type=float, default=0.2, help='GA share of greedily seeded schedules')
+    parser.add_argument('--memetic', action='store_true', help='GA with the local-search step')
+    parser.add_argument('--data-root', help='keep the generated instances in this directory')
+    parser.add_argument('--output', help='write the results to this CSV file')
+    parser.add_argument('--baseline', help='results CSV of an earlier run to compare wall times against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed slowdown against the baseline')
+    args = parser.parse_args()
+
+    settings = {'population': args.population, 'generations': args.generations,
+                'seed_rate': args.seed_rate, 'memetic': args.memetic}
+    results = run_benchmark(args.groups, args.solvers, args.seed, args.room_slack, args.lecturer_slack,
+                            args.timeout, args.data_root, settings)
+    print_results(results)
+    if args.output:
+        write_results(results, args.output)
+    if args.baseline:
+        regressions = find_regressions(results, read_results(args.baseline), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        if regressions:
+            sys.exit(1)
@@ -0,0 +1,393 @@
+import json
+import math
+import argparse
+from collections import defaultdict
+
+# Pluggable hard constraints for the CSP solver.
+# Every constraint keeps its own index of the current assignment, updated by assign/unassign
+# hooks, so a check is a dictionary lookup instead of a scan over the whole assignment.
+# Every constraint also declares its scope - the part of (lesson, value) its check reads.
+# ConstraintSet groups the constraints by scope and checks a scope once per scope key while
+# the assignment is unchanged: e.g. a lecturer clash at (day, period, lecturer) rejects every
+# auditorium for that lecturer and slot with one check. Scopes and the constraints in them run
+# cheapest and most failing first.
+#
+# A new rule is a Constraint subclass registered with @register. It is made active by passing
+# an instance in the constraints list of CSP, or by name through build().
+
+MAX_LECTURER_DAILY_HOURS = 3  # Default limit of LecturerDailyHours
+REORDER_INTERVAL = 1000  # Checks between reorderings of the constraint set
+
+CONSTRAINTS = {}  # name -> Constraint subclass
+DEFAULT_CONSTRAINTS = ['room_slot', 'lecturer_slot', 'group_slot', 'room_capacity', 'lecturer_weekly_hours',
+                       'week_type', 'lecturer_daily_hours']
+
+# Scope -> key of the (lesson, value) parts a check in that scope reads;
+# value = (day, period, auditorium_id, lecturer_id). 'value' reads everything and is not cached.
+SCOPE_KEYS = {
+    'lesson': lambda lesson, value: lesson.id,
+    'slot': lambda lesson, value: (lesson.id, value[0], value[1]),
+    'day': lambda lesson, value: (lesson.id, value[0], value[3]),
+    'room': lambda lesson, value: (lesson.id, value[0], value[1], value[2]),
+    'lecturer': lambda lesson, value: (lesson.id, value[0], value[1], value[3]),
+    'value': None
+}
+
+
+def register(cls):
+    CONSTRAINTS[cls.name] = cls
+    return cls
+
+
+def lesson_size(lesson):
+    # Students attending the lesson: a subgroup or the whole group
+    if lesson.subgroup and lesson.group.subgroups:
+        return math.ceil(lesson.group.size / len(lesson.group.subgroups))
+    return lesson.group.size
+
+
+class Constraint:
+    name = ''
+    scope = 'value'  # Key of SCOPE_KEYS: the parts of (lesson, value) check() reads
+    cost = 1  # Relative cost of a check; static checks on the lesson alone cost 0
+
+    def compile(self, csp, week_number):
+        # Precompute whatever does not depend on the assignment
+        pass
+
+    def check(self, lesson, value):
+        # value = (day, period, auditorium_id, lecturer_id); True if it may be assigned to lesson
+        return True
+
+    def assign(self, lesson, value):
+        pass
+
+    def unassign(self, lesson, value):
+        pass
+
+
+@register
+class RoomSlot(Constraint):
+    # 1. One lesson per auditorium at a time
+    name = 'room_slot'
+    scope = 'room'
+
+    def compile(self, csp, week_number):
+        self.taken = set()  # (day, period, auditorium_id)
+
+    def check(self, lesson, value):
+        day, period, aud, lect = value
+        return (day, period, aud) not in self.taken
+
+    def assign(self, lesson, value):
+        day, period, aud, lect = value
+        self.taken.add((day, period, aud))
+
+    def unassign(self, lesson, value):
+        day, period, aud, lect = value
+        self.taken.discard((day, period, aud))
+
+
+@register
+class LecturerSlot(Constraint):
+    # 2. One lesson per lecturer at a time
+    name = 'lecturer_slot'
+    scope = 'lecturer'
+
+    def compile(self, csp, week_number):
+        self.taken = set()  # (day, period, lecturer_id)
+
+    def check(self, lesson, value):
+        day, period, aud, lect = value
+        return (day, period, lect) not in self.taken
+
+    def assign(self, lesson, value):
+        day, period, aud, lect = value
+        self.taken.add((day, period, lect))
+
+    def unassign(self, lesson, value):
+        day, period, aud, lect = value
+        self.taken.discard((day, period, lect))
+
+
+@register
+class GroupSlot(Constraint):
+    # 3. One lesson per group at a time; different subgroups may have lessons in parallel
+    name = 'group_slot'
+    scope = 'slot'
+
+    def compile(self, csp, week_number):
+        self.taken = defaultdict(list)  # (day, period, group.number) -> subgroups (None - whole group)
+
+    def check(self, lesson, value):
+        day, period, aud, lect = value
+        taken = self.taken.get((day, period, lesson.group.number))
+        if not taken:
+            return True
+        if not lesson.subgroup or None in taken:
+            return False
+        return lesson.subgroup not in taken
+
+    def assign(self, lesson, value):
+        day, period, aud, lect = value
+        self.taken[(day, period, lesson.group.number)].append(lesson.subgroup or None)
+
+    def unassign(self, lesson, value):
+        day, period, aud, lect = value
+        self.taken[(day, period, lesson.group.number)].remove(lesson.subgroup or None)
+
+
+@register
+class RoomCapacity(Constraint):
+    # 4. The auditorium is large enough
+    name = 'room_capacity'
+    scope = 'room'
+    cost = 0
+
+    def compile(self, csp, week_number):
+        self.capacity = {auditorium.id: auditorium.capacity for auditorium in csp.auditoriums}
+
+    def check(self, lesson, value):
+        capacity = self.capacity.get(value[2])
+        return capacity is None or capacity >= lesson_size(lesson)
+
+
+@register
+class LecturerWeeklyHours(Constraint):
+    # 5. A lecturer does not exceed their weekly maximum
+    name = 'lecturer_weekly_hours'
+    scope = 'lecturer'
+
+    def compile(self, csp, week_number):
+        self.max_hours = {lecturer.id: lecturer.max_hours_per_week for lecturer in csp.lecturers}
+        self.hours = defaultdict(int)  # lecturer_id -> assigned lessons
+
+    def check(self, lesson, value):
+        max_hours = self.max_hours.get(value[3])
+        return max_hours is None or self.hours[value[3]] < max_hours
+
+    def assign(self, lesson, value):
+        self.hours[value[3]] += 1
+
+    def unassign(self, lesson, value):
+        self.hours[value[3]] -= 1
+
+
+@register
+class WeekType(Constraint):
+    # 6. Subjects of the other week type are not scheduled; 'both' always are
+    name = 'week_type'
+    scope = 'lesson'
+    cost = 0
+
+    def compile(self, csp, week_number):
+        self.week_type = 'even' if week_number % 2 == 0 else 'odd'
+
+    def check(self, lesson, value):
+        return lesson.subject.week_type in ('both', self.week_type)
+
+
+@register
+class LecturerDailyHours(Constraint):
+    # 7. At most limit lessons per lecturer per day
+    name = 'lecturer_daily_hours'
+    scope = 'day'
+
+    def __init__(self, limit=MAX_LECTURER_DAILY_HOURS):
+        self.limit = limit
+
+    def compile(self, csp, week_number):
+        self.hours = defaultdict(int)  # (lecturer_id, day) -> assigned lessons
+
+    def check(self, lesson, value):
+        return self.hours[(value[3], value[0])] < self.limit
+
+    def assign(self, lesson, value):
+        self.hours[(value[3], value[0])] += 1
+
+    def unassign(self, lesson, value):
+        self.hours[(value[3], value[0])] -= 1
+
+
+@register
+class GroupDailyLessons(Constraint):
+    # At most limit lessons per group per day, counted per subgroup; a whole-group lesson counts for all
+    name = 'group_daily_lessons'
+    scope = 'day'
+
+    def __init__(self, limit):
+        self.limit = limit
+
+    def compile(self, csp, week_number):
+        self.lessons = defaultdict(int)  # (group.number, subgroup, day) -> assigned lessons
+        self.subgroups = {lesson.group.number: lesson.group.subgroups or [None] for lesson in csp.variables}
+
+    def _keys(self, lesson, day):
+        subgroups = [lesson.subgroup] if lesson.subgroup else self.subgroups[lesson.group.number]
+        return [(lesson.group.number, subgroup, day) for subgroup in subgroups]
+
+    def check(self, lesson, value):
+        return all(self.lessons[key] < self.limit for key in self._keys(lesson, value[0]))
+
+    def assign(self, lesson, value):
+        for key in self._keys(lesson, value[0]):
+            self.lessons[key] += 1
+
+    def unassign(self, lesson, value):
+        for key in self._keys(lesson, value[0]):
+            self.lessons[key] -= 1
+
+
+@register
+class LecturerUnavailable(Constraint):
+    # Slots a lecturer is not available in: {lecturer_id: {(day, period), ...}}
+    name = 'lecturer_unavailable'
+    scope = 'lecturer'
+    cost = 0
+
+    def __init__(self, unavailable):
+        self.unavailable = {lecturer_id: {tuple(slot) for slot in slots} for lecturer_id, slots in unavailable.items()}
+
+    def check(self, lesson, value):
+        return (value[0], value[1]) not in self.unavailable.get(value[3], ())
+
+
+@register
+class BuildingTravel(Constraint):
+    # No time to move to another building between consecutive periods of a group or a lecturer:
+    # buildings = {auditorium_id: building}
+    name = 'building_travel'
+    scope = 'value'
+    cost = 2
+
+    def __init__(self, buildings):
+        self.buildings = buildings
+
+    def compile(self, csp, week_number):
+        self.at = defaultdict(list)  # ('group'|'lecturer', key, day, period) -> buildings
+
+    def _keys(self, lesson, value):
+        day, period, aud, lect = value
+        return [('group', lesson.group.number, day, period), ('lecturer', lect, day, period)]
+
+    def check(self, lesson, value):
+        day, period, aud, lect = value
+        building = self.buildings.get(aud)
+        if building is None:
+            return True
+        for kind, key, day, period in self._keys(lesson, value):
+            for neighbour in (str(int(period) - 1), str(int(period) + 1)):
+                if any(other != building for other in self.at.get((kind, key, day, neighbour), ())):
+                    return False
+        return True
+
+    def assign(self, lesson, value):
+        building = self.buildings.get(value[2])
+        if building is not None:
+            for key in self._keys(lesson, value):
+                self.at[key].append(building)
+
+    def unassign(self, lesson, value):
+        building = self.buildings.get(value[2])
+        if building is not None:
+            for key in self._keys(lesson, value):
+                self.at[key].remove(building)
+
+
+def build(spec):
+    # Constraints by registry name: 'name' or ('name', {keyword arguments}), e.g. from JSON settings
+    rules = []
+    for entry in spec:
+        name, kwargs = (entry, {}) if isinstance(entry, str) else entry
+        if name not in CONSTRAINTS:
+            raise ValueError(f"Unknown constraint: {name}")
+        try:
+            rules.append(CONSTRAINTS[name](**kwargs))
+        except (TypeError, AttributeError) as e:
+            raise ValueError(f"Bad arguments of constraint {name}: {e}") from e
+    return rules
+
+
+def parse_spec(text):
+    # Command-line form of a build() entry: NAME or NAME:JSON object of keyword arguments.
+    # The rule is built once here, so a bad name or argument is a usage error
+    name, _, arguments = text.partition(':')
+    try:
+        entry = name, json.loads(arguments) if arguments else {}
+        build([entry])
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e)) from e
+    return entry
+
+
+def default_constraints(spec=()):
+    # The hard constraints the CSP has always enforced, with the rules of spec (see build());
+    # a rule named like a default one replaces it, e.g. lecturer_daily_hours with another limit
+    rules = build(spec)
+    names = {rule.name for rule in rules}
+    return [rule for rule in build(DEFAULT_CONSTRAINTS) if rule.name not in names] + rules
+
+
+class ConstraintSet:
+    # Active constraints compiled for one search, grouped by scope. A scope's verdict for a key is
+    # cached until the next assign/unassign; the order of the checks follows cost per observed failure.
+    def __init__(self, constraints, csp, week_number):
+        self.constraints = list(constraints)
+        for constraint in self.constraints:
+            if constraint.scope not in SCOPE_KEYS:
+                raise ValueError(f"Unknown scope {constraint.scope!r} of constraint {constraint.name}")
+            constraint.compile(csp, week_number)
+        self.checks = {constraint: 0 for constraint in self.constraints}
+        self.failures = {constraint: 0 for constraint in self.constraints}
+        self.verdicts = {scope: {} for scope in SCOPE_KEYS}  # scope -> scope key -> bool
+        self.total_checks = 0
+        self._reorder()
+
+    def _priority(self, constraint):
+        failure_rate = (self.failures[constraint] + 1) / (self.checks[constraint] + 2)
+        return (constraint.cost + 1) / failure_rate
+
+    def _reorder(self):
+        scopes = {}
+        for constraint in sorted(self.constraints, key=self._priority):
+            scopes.setdefault(constraint.scope, []).append(constraint)
+        # (scope key function, verdict cache, constraints), the scope with the best constraint first
+        self.scopes = [(SCOPE_KEYS[scope], self.verdicts[scope], constraints) for scope, constraints in scopes.items()]
+
+    def _check_scope(self, constraints, lesson, value):
+        for constraint in constraints:
+            self.checks[constraint] += 1
+            if not constraint.check(lesson, value):
+                self.failures[constraint] += 1
+                return False
+        return True
+
+    def check(self, lesson, value):
+        self.total_checks += 1
+        if self.total_checks % REORDER_INTERVAL == 0:
+            self._reorder()
+        for scope_key, verdicts, constraints in self.scopes:
+            if scope_key is None:
+                verdict = self._check_scope(constraints, lesson, value)
+            else:
+                key = scope_key(lesson, value)
+                verdict = verdicts.get(key)
+                if verdict is None:
+                    verdict = verdicts[key] = self._check_scope(constraints, lesson, value)
+            if not verdict:
+                return False
+        return True
+
+    def _changed(self):
+        for verdicts in self.verdicts.values():
+            verdicts.clear()
+
+    def assign(self, lesson, value):
+        for constraint in self.constraints:
+            constraint.assign(lesson, value)
+        self._changed()
+
+    def unassign(self, lesson, value):
+        for constraint in self.constraints:
+            constraint.unassign(lesson, value)
+        self._changed()
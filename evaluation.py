@@ -0,0 +1,145 @@
+import numpy as np
+
+# Timetable quality evaluation shared by CSP.py and test_lab.py.
+# A solution is turned into dense occupancy arrays
+#   groups:    (week x group unit x day x period), a unit is a subgroup or a group without subgroups
+#   lecturers: (week x lecturer x day x period)
+# and every metric is computed with array operations. Many candidates can be scored at once
+# (evaluate_many), which adds a leading candidate axis to the arrays.
+
+WEEKS = ['even', 'odd']
+MAX_LECTURER_DAILY_HOURS = 3  # Same default limit as the hard constraint constraints.LecturerDailyHours
+LECTURER_OVERLOAD_WEIGHT = 2  # Penalty per lesson over a lecturer's weekly maximum, as in test_lab.py
+
+
+def placements_from_csp(solution, lessons, week=None):
+    # CSP solution: lesson_id -> (day, period, auditorium_id, lecturer_id);
+    # lessons of 'both' subjects take place in both weeks. week - only the placements of that
+    # week type, e.g. for a solution of one calendar week
+    lessons_by_id = {lesson.id: lesson for lesson in lessons}
+    placements = []
+    for lesson_id, (day, period, aud, lect_id) in solution.items():
+        lesson = lessons_by_id.get(lesson_id)
+        if not lesson:
+            continue
+        week_type = lesson.subject.week_type
+        weeks = WEEKS if week_type == 'both' else [week_type]
+        for lesson_week in weeks:
+            if week is None or lesson_week == week:
+                placements.append((lesson_week, lesson.group.number, lesson.subgroup, day, period, lect_id))
+    return placements
+
+
+def placements_from_schedule(schedule):
+    # GA schedule: even and odd week timetables of time_slot -> lessons
+    placements = []
+    for week, timetable in (('even', schedule.even_timetable), ('odd', schedule.odd_timetable)):
+        for (day, period), lessons in timetable.items():
+            for lesson in lessons:
+                placements.append((week, lesson.group.number, lesson.subgroup, day, period,
+                                   lesson.lecturer.id if lesson.lecturer else None))
+    return placements
+
+
+def _day_metrics(occupancy):
+    # Per (..., day): lessons, idle periods between the first and the last lesson, number of windows
+    busy = occupancy > 0
+    periods = busy.shape[-1]
+    lessons = busy.sum(-1)
+    first = busy.argmax(-1)
+    last = periods - 1 - busy[..., ::-1].argmax(-1)
+    idle = np.where(lessons > 0, last - first + 1 - lessons, 0)
+    starts = busy[..., 0].astype(np.int64) + (busy[..., 1:] & ~busy[..., :-1]).sum(-1)
+    windows = np.maximum(starts - 1, 0)
+    return lessons, idle, windows
+
+
+class Evaluator:
+    def __init__(self, groups, lecturers, days, periods):
+        self.days = {day: i for i, day in enumerate(days)}
+        self.periods = {period: i for i, period in enumerate(periods)}
+        self.weeks = {week: i for i, week in enumerate(WEEKS)}
+        # (group.number, subgroup) -> indexes of the units the lesson occupies;
+        # a whole-group lesson of a group with subgroups occupies every subgroup
+        self.units = {}
+        unit_count = 0
+        for group in groups:
+            if group.subgroups:
+                first_unit = unit_count
+                for subgroup in group.subgroups:
+                    self.units[(group.number, subgroup)] = [unit_count]
+                    unit_count += 1
+                self.units[(group.number, None)] = list(range(first_unit, unit_count))
+            else:
+                self.units[(group.number, None)] = [unit_count]
+                unit_count += 1
+        self.unit_count = unit_count
+        self.lecturers = {lecturer.id: i for i, lecturer in enumerate(lecturers)}
+        self.max_hours = np.array([lecturer.max_hours_per_week for lecturer in lecturers], dtype=np.int64)
+
+    def _flat_indexes(self, placements):
+        # Flat indexes into the group and lecturer occupancy arrays of one candidate
+        day_count = len(self.days)
+        period_count = len(self.periods)
+        group_indexes = []
+        lecturer_indexes = []
+        for week, group_number, subgroup, day, period, lect_id in placements:
+            slot = self.days[day] * period_count + self.periods[period]
+            w = self.weeks[week]
+            for unit in self.units.get((group_number, subgroup), ()):
+                group_indexes.append((w * self.unit_count + unit) * day_count * period_count + slot)
+            lecturer = self.lecturers.get(lect_id)
+            if lecturer is not None:
+                lecturer_indexes.append((w * len(self.lecturers) + lecturer) * day_count * period_count + slot)
+        return group_indexes, lecturer_indexes
+
+    def occupancy(self, placements_batch):
+        # Lesson counts per cell for every candidate: groups (N, W, U, D, P), lecturers (N, W, L, D, P)
+        shape_tail = (len(self.days), len(self.periods))
+        group_size = len(self.weeks) * self.unit_count * shape_tail[0] * shape_tail[1]
+        lecturer_size = len(self.weeks) * len(self.lecturers) * shape_tail[0] * shape_tail[1]
+        group_indexes = []
+        lecturer_indexes = []
+        for candidate, placements in enumerate(placements_batch):
+            groups_flat, lecturers_flat = self._flat_indexes(placements)
+            group_indexes.append(np.asarray(groups_flat, dtype=np.int64) + candidate * group_size)
+            lecturer_indexes.append(np.asarray(lecturers_flat, dtype=np.int64) + candidate * lecturer_size)
+        count = len(placements_batch)
+        group_occupancy = np.bincount(np.concatenate(group_indexes) if group_indexes else np.zeros(0, np.int64),
+                                      minlength=count * group_size)
+        lecturer_occupancy = np.bincount(
+            np.concatenate(lecturer_indexes) if lecturer_indexes else np.zeros(0, np.int64),
+            minlength=count * lecturer_size)
+        return (group_occupancy.reshape((count, len(self.weeks), self.unit_count) + shape_tail),
+                lecturer_occupancy.reshape((count, len(self.weeks), len(self.lecturers)) + shape_tail))
+
+    def evaluate_many(self, placements_batch):
+        # Metrics for every candidate as arrays of length len(placements_batch)
+        group_occupancy, lecturer_occupancy = self.occupancy(placements_batch)
+        group_lessons, group_idle, group_windows = _day_metrics(group_occupancy)
+        lecturer_lessons, lecturer_idle, lecturer_windows = _day_metrics(lecturer_occupancy)
+        weekly_hours = lecturer_occupancy.sum(axis=(-2, -1))  # (N, W, L)
+        overload = np.maximum(weekly_hours - self.max_hours, 0).sum(axis=(1, 2))
+        conflicts = (np.maximum(group_occupancy - 1, 0).sum(axis=(1, 2, 3, 4)) +
+                     np.maximum(lecturer_occupancy - 1, 0).sum(axis=(1, 2, 3, 4)))
+        window_periods = group_idle.sum(axis=(1, 2, 3))
+        lecturer_idle_periods = lecturer_idle.sum(axis=(1, 2, 3))
+        count = len(placements_batch)
+        return {
+            'windows': group_windows.sum(axis=(1, 2, 3)),
+            'window_periods': window_periods,
+            'lecturer_windows': lecturer_windows.sum(axis=(1, 2, 3)),
+            'lecturer_idle_periods': lecturer_idle_periods,
+            'lecturer_overload': overload,
+            'lecturer_daily_excess': np.maximum(lecturer_lessons - MAX_LECTURER_DAILY_HOURS, 0).sum(axis=(1, 2, 3)),
+            'conflicts': conflicts,
+            'max_group_daily_load': group_lessons.reshape(count, -1).max(axis=1, initial=0),
+            'group_daily_load_std': group_lessons.reshape(count, -1).std(axis=1) if group_lessons.size
+            else np.zeros(count),
+            # Soft penalty used by the GA: idle periods of groups and lecturers plus lecturer overload
+            'penalty': window_periods + lecturer_idle_periods + LECTURER_OVERLOAD_WEIGHT * overload
+        }
+
+    def evaluate(self, placements):
+        # Metrics of a single candidate as plain Python numbers
+        return {name: values[0].item() for name, values in self.evaluate_many([placements]).items()}
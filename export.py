@@ -0,0 +1,250 @@
+import csv
+import os
+import sys
+import json
+import contextlib
+import math
+import datetime
+
+# Streaming export of a timetable as CSV, JSON Lines or iCalendar.
+# A solution is walked as placements - tuples of references to the solver's own objects -
+# and each row is formatted only when it is written, so the whole formatted timetable
+# is never held in memory. Per-group and per-lecturer views write every placement to the
+# file of its entity as it comes, with one open writer per entity.
+
+FORMATS = ['csv', 'jsonl', 'ics']
+VIEWS = ['group', 'lecturer']
+FIELDS = ['week', 'day', 'period', 'group', 'subgroup', 'subject_id', 'subject', 'type',
+          'lecturer_id', 'lecturer', 'auditorium', 'students', 'capacity']
+WEEKS = ['odd', 'even']  # Week 1 of the term is odd, as in CSP.solve
+DAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday']  # As in CSP.py and test_lab.py
+# Start and end of every period
+PERIOD_TIMES = {
+    '1': ((8, 40), (10, 15)),
+    '2': ((10, 35), (12, 10)),
+    '3': ((12, 20), (13, 55)),
+    '4': ((14, 5), (15, 40))
+}
+
+
+def placements_from_csp(solution, lessons, lecturers, auditoriums):
+    # CSP solution: lesson_id -> (day, period, auditorium_id, lecturer_id), in time order per week
+    lessons_by_id = {lesson.id: lesson for lesson in lessons}
+    lecturers_by_id = {lecturer.id: lecturer for lecturer in lecturers}
+    auditoriums_by_id = {auditorium.id: auditorium for auditorium in auditoriums}
+    day_index = {day: i for i, day in enumerate(DAYS)}
+    order = sorted(solution, key=lambda lesson_id: (day_index[solution[lesson_id][0]], int(solution[lesson_id][1])))
+    for week in WEEKS:
+        for lesson_id in order:
+            lesson = lessons_by_id.get(lesson_id)
+            if not lesson or lesson.subject.week_type not in ('both', week):
+                continue
+            day, period, aud, lect_id = solution[lesson_id]
+            if lesson.subgroup and lesson.group.subgroups:
+                students = math.ceil(lesson.group.size / len(lesson.group.subgroups))
+            else:
+                students = lesson.group.size
+            yield (week, day, period, lesson, lecturers_by_id.get(lect_id), auditoriums_by_id.get(aud), students)
+
+
+def placements_from_horizon(weeks, lessons, lecturers, auditoriums):
+    # Semester horizon: (week_number, CSP solution) per calendar week; the week column is the week number
+    lessons_by_id = {lesson.id: lesson for lesson in lessons}
+    lecturers_by_id = {lecturer.id: lecturer for lecturer in lecturers}
+    auditoriums_by_id = {auditorium.id: auditorium for auditorium in auditoriums}
+    day_index = {day: i for i, day in enumerate(DAYS)}
+    for week, solution in weeks:
+        order = sorted(solution, key=lambda lesson_id: (day_index[solution[lesson_id][0]],
+                                                        int(solution[lesson_id][1])))
+        for lesson_id in order:
+            lesson = lessons_by_id[lesson_id]
+            day, period, aud, lect_id = solution[lesson_id]
+            if lesson.subgroup and lesson.group.subgroups:
+                students = math.ceil(lesson.group.size / len(lesson.group.subgroups))
+            else:
+                students = lesson.group.size
+            yield (week, day, period, lesson, lecturers_by_id.get(lect_id), auditoriums_by_id.get(aud), students)
+
+
+def placements_from_schedule(schedule, time_slots):
+    # GA schedule: even and odd week timetables of time_slot -> lessons
+    for week in WEEKS:
+        timetable = schedule.even_timetable if week == 'even' else schedule.odd_timetable
+        for time_slot in time_slots:
+            for lesson in timetable[time_slot]:
+                if lesson.subgroup and lesson.group.subgroups:
+                    students = lesson.group.size // len(lesson.group.subgroups)
+                else:
+                    students = lesson.group.size
+                yield (week, time_slot[0], time_slot[1], lesson, lesson.lecturer, lesson.auditorium, students)
+
+
+def format_row(placement):
+    week, day, period, lesson, lecturer, auditorium, students = placement
+    return {
+        'week': week,
+        'day': day,
+        'period': period,
+        'group': lesson.group.number,
+        'subgroup': lesson.subgroup or '',
+        'subject_id': lesson.subject.id,
+        'subject': lesson.subject.name,
+        'type': lesson.type,
+        'lecturer_id': lecturer.id if lecturer else '',
+        'lecturer': lecturer.name if lecturer else 'N/A',
+        'auditorium': auditorium.id if auditorium else 'N/A',
+        'students': students,
+        'capacity': auditorium.capacity if auditorium else ''
+    }
+
+
+class CsvWriter:
+    def __init__(self, out, term_start=None):
+        self.writer = csv.writer(out, delimiter=';')
+        self.writer.writerow(FIELDS)
+
+    def write(self, placement):
+        row = format_row(placement)
+        self.writer.writerow([row[field] for field in FIELDS])
+
+    def close(self):
+        pass
+
+
+class JsonlWriter:
+    def __init__(self, out, term_start=None):
+        self.out = out
+
+    def write(self, placement):
+        self.out.write(json.dumps(format_row(placement), ensure_ascii=False))
+        self.out.write('\n')
+
+    def close(self):
+        pass
+
+
+def _ical_escape(text):
+    return str(text).replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\n', '\\n')
+
+
+def _ical_line(out, line):
+    # Content lines are folded at 75 octets (RFC 5545)
+    encoded = line.encode('utf-8')
+    while len(encoded) > 75:
+        cut = 75
+        while (encoded[cut] & 0xC0) == 0x80:  # Do not split a UTF-8 character
+            cut -= 1
+        out.write(encoded[:cut].decode('utf-8') + '\r\n')
+        encoded = b' ' + encoded[cut:]
+    out.write(encoded.decode('utf-8') + '\r\n')
+
+
+class IcsWriter:
+    # One weekly-alternating event series per lesson; term_start is the Monday of the first (odd) week.
+    # Placements of a semester horizon carry the week number and become single events.
+    def __init__(self, out, term_start=None, weeks=16):
+        self.out = out
+        self.term_start = term_start or datetime.date.today()
+        self.weeks = weeks
+        self.number = 0
+        self.stamp = datetime.datetime.now(datetime.timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+        _ical_line(out, 'BEGIN:VCALENDAR')
+        _ical_line(out, 'VERSION:2.0')
+        _ical_line(out, 'PRODID:-//IS_lab_4//Timetable//UK')
+
+    def write(self, placement):
+        out = self.out
+        row = format_row(placement)
+        if isinstance(row['week'], int):
+            first_day = self.term_start + datetime.timedelta(days=DAYS.index(row['day']) + 7 * (row['week'] - 1))
+        else:
+            first_day = self.term_start + datetime.timedelta(days=DAYS.index(row['day']) +
+                                                             7 * WEEKS.index(row['week']))
+        (start_hour, start_minute), (end_hour, end_minute) = PERIOD_TIMES[row['period']]
+        start = datetime.datetime.combine(first_day, datetime.time(start_hour, start_minute))
+        end = datetime.datetime.combine(first_day, datetime.time(end_hour, end_minute))
+        group = row['group'] + (f" ({row['subgroup']})" if row['subgroup'] else '')
+        _ical_line(out, 'BEGIN:VEVENT')
+        _ical_line(out, f"UID:{self.number}-{row['week']}-{row['day']}-{row['period']}-{row['group']}"
+                        f"-{row['subject_id']}-{row['subgroup']}@is-lab-4")
+        _ical_line(out, f"DTSTAMP:{self.stamp}")
+        _ical_line(out, f"DTSTART:{start.strftime('%Y%m%dT%H%M%S')}")
+        _ical_line(out, f"DTEND:{end.strftime('%Y%m%dT%H%M%S')}")
+        if not isinstance(row['week'], int):
+            count = math.ceil((self.weeks - WEEKS.index(row['week'])) / 2)
+            _ical_line(out, f"RRULE:FREQ=WEEKLY;INTERVAL=2;COUNT={count}")
+        _ical_line(out, f"SUMMARY:{_ical_escape(row['subject'] + ' (' + row['type'] + ')')}")
+        _ical_line(out, f"LOCATION:{_ical_escape(row['auditorium'])}")
+        _ical_line(out, f"DESCRIPTION:{_ical_escape(group + ', ' + row['lecturer'])}")
+        _ical_line(out, 'END:VEVENT')
+        self.number += 1
+
+    def close(self):
+        _ical_line(self.out, 'END:VCALENDAR')
+
+
+WRITERS = {'csv': CsvWriter, 'jsonl': JsonlWriter, 'ics': IcsWriter}
+
+
+def open_writer(fmt, out, term_start=None):
+    if fmt not in WRITERS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    return WRITERS[fmt](out, term_start)
+
+
+def write(placements, fmt, out, term_start=None):
+    writer = open_writer(fmt, out, term_start)
+    for placement in placements:
+        writer.write(placement)
+    writer.close()
+
+
+def _view_key(placement, view):
+    week, day, period, lesson, lecturer, auditorium, students = placement
+    if view == 'group':
+        return lesson.group.number
+    return lecturer.id if lecturer else 'N/A'
+
+
+def export(placements, fmt, output='-', view=None, term_start=None):
+    # Without a view: one stream to output ('-' - stdout).
+    # With a view: output is a directory with one file per group or lecturer; every file is
+    # opened when its first placement arrives and each placement is written as it comes.
+    if not view:
+        if output == '-':
+            write(placements, fmt, sys.stdout, term_start)
+        else:
+            with open(output, 'w', newline='', encoding='utf-8') as out:
+                write(placements, fmt, out, term_start)
+        return
+    if output == '-':
+        raise ValueError('A view is written to a directory, not to stdout')
+    os.makedirs(output, exist_ok=True)
+    writers = {}
+    with contextlib.ExitStack() as files:
+        for placement in placements:
+            key = _view_key(placement, view)
+            writer = writers.get(key)
+            if writer is None:
+                filename = ''.join(c if c.isalnum() or c in '-_.' else '_' for c in str(key))
+                out = files.enter_context(open(os.path.join(output, f"{filename}.{fmt}"), 'w', newline='',
+                                               encoding='utf-8'))
+                writer = writers[key] = open_writer(fmt, out, term_start)
+            writer.write(placement)
+        for writer in writers.values():
+            writer.close()
+
+
+def add_arguments(parser):
+    # Export options shared by CSP.py, test_lab.py and horizon.py; check with check_arguments after parsing
+    parser.add_argument('--export', choices=FORMATS, help='stream the timetable in this format instead of printing it')
+    parser.add_argument('--output', default='-', help="export file ('-' - stdout), or directory (required) with --view")
+    parser.add_argument('--view', choices=VIEWS, help='write one file per group or lecturer')
+    parser.add_argument('--term-start', type=datetime.date.fromisoformat,
+                        help='Monday of the first (odd) week for iCalendar export, YYYY-MM-DD')
+
+
+def check_arguments(parser, args):
+    # A view writes one file per entity, so it needs a directory
+    if args.view and args.output == '-':
+        parser.error('--view needs --output DIRECTORY')
@@ -0,0 +1,174 @@
+import sys
+import time
+import contextlib
+import argparse
+from tabulate import tabulate
+
+import CSP
+import export
+import evaluation
+
+# Semester-horizon scheduling with the CSP solver.
+# Every calendar week is reduced to its pattern - the days with lessons and the subjects taught
+# that week (active by start week and matching the week type). Each distinct pattern is solved
+# once and its solution is the template of every week with that pattern. A new pattern starts
+# from the solution of the closest pattern solved so far, so only the lessons that no longer
+# fit are searched for again.
+
+
+class Calendar:
+    def __init__(self, weeks, holidays=None, subject_starts=None):
+        self.weeks = weeks
+        self.holidays = holidays or {}  # week -> days without lessons
+        self.subject_starts = subject_starts or {}  # subject_id -> first week of the subject
+
+    def days(self, week):
+        return tuple(day for day in CSP.DAYS if day not in self.holidays.get(week, ()))
+
+    def pattern(self, week, subjects):
+        days = self.days(week)
+        if not days:
+            return (), frozenset()  # No lessons at all this week
+        week_type = 'even' if week % 2 == 0 else 'odd'
+        active = frozenset(subject.id for subject in subjects
+                           if self.subject_starts.get(subject.id, 1) <= week and subject.week_type in ('both', week_type))
+        return days, active
+
+
+def _similarity(pattern, other):
+    days, subjects = pattern
+    other_days, other_subjects = other
+    return len(set(days) & set(other_days)) + len(subjects & other_subjects)
+
+
+def _solve_pattern(pattern, week, lessons, domains, lecturers, auditoriums, constraints, initial):
+    days, subjects = pattern
+    pattern_lessons = [lesson for lesson in lessons if lesson.subject.id in subjects]
+    pattern_domains = {lesson.id: [value for value in domains[lesson.id] if value[0] in days]
+                       for lesson in pattern_lessons if lesson.id in domains}
+    csp = CSP.CSP(variables=pattern_lessons, domains=pattern_domains, lecturers=lecturers,
+                  auditoriums=auditoriums, constraints=constraints() if constraints else None)
+    solution = csp.solve(week, initial)
+    nodes = csp.nodes
+    if solution is None and initial:
+        # Fixed lessons of the template can make the week infeasible; solve it from scratch
+        csp = CSP.CSP(variables=pattern_lessons, domains=pattern_domains, lecturers=lecturers,
+                      auditoriums=auditoriums, constraints=constraints() if constraints else None)
+        solution = csp.solve(week)
+        nodes += csp.nodes
+        initial = None
+    return solution, pattern_lessons, nodes, initial is not None
+
+
+def solve_horizon(calendar, subjects, lessons, domains, lecturers, auditoriums, constraints=None):
+    # constraints - optional factory of the hard constraint list, called once per solved pattern.
+    # Returns the solution of every week (None if a week is infeasible) and a report per pattern.
+    unknown = sorted(set(calendar.subject_starts) - set(subject.id for subject in subjects))
+    if unknown:
+        raise ValueError(f"Unknown subject id in subject starts: {', '.join(unknown)}")
+    patterns = {}  # pattern -> index into report
+    report = []
+    weeks = []
+    for week in range(1, calendar.weeks + 1):
+        pattern = calendar.pattern(week, subjects)
+        if pattern not in patterns:
+            start = time.perf_counter()
+            # Template: the closest pattern solved so far
+            template = max((entry for entry in report if entry['solution'] is not None),
+                           key=lambda entry: _similarity(pattern, entry['pattern']), default=None)
+            solution, pattern_lessons, nodes, warm = _solve_pattern(
+                pattern, week, lessons, domains, lecturers, auditoriums, constraints,
+                template['solution'] if template else None)
+            patterns[pattern] = len(report)
+            report.append({
+                'pattern': pattern,
+                'weeks': [],
+                'lessons': pattern_lessons,
+                'solution': solution,
+                'nodes': nodes,
+                'template': template['index'] if warm else None,
+                'reused': sum(1 for lesson_id, value in solution.items()
+                              if template['solution'].get(lesson_id) == value) if warm and solution is not None else 0,
+                'time': time.perf_counter() - start,
+                'index': len(report)
+            })
+        entry = report[patterns[pattern]]
+        entry['weeks'].append(week)
+        weeks.append((week, entry['solution']))
+    return weeks, report
+
+
+def print_report(report, groups, lecturers):
+    headers = ['Pattern', 'Weeks', 'Days', 'Subjects', 'Lessons', 'Template', 'Reused', 'Nodes', 'Time', 'Windows']
+    evaluator = evaluation.Evaluator(groups, lecturers, CSP.DAYS, CSP.PERIODS)
+    table = []
+    for entry in report:
+        days, subjects = entry['pattern']
+        if entry['solution'] is not None:
+            # A solution is one calendar week: 'both' lessons are counted once, in its week type
+            week_type = 'even' if entry['weeks'][0] % 2 == 0 else 'odd'
+            windows = evaluator.evaluate(evaluation.placements_from_csp(entry['solution'], entry['lessons'],
+                                                                        week_type))['windows']
+        else:
+            windows = 'infeasible'
+        table.append([entry['index'], ','.join(str(week) for week in entry['weeks']), len(days), len(subjects),
+                      len(entry['lessons']), '' if entry['template'] is None else entry['template'],
+                      entry['reused'], entry['nodes'], f"{entry['time']:.2f}", windows])
+    print(tabulate(table, headers=headers, tablefmt="grid", stralign="center"))
+
+
+def parse_holiday(text):
+    # WEEK (the whole week) or WEEK:DAY[,DAY...]
+    week, _, days = text.partition(':')
+    days = days.split(',') if days else CSP.DAYS
+    unknown = [day for day in days if day not in CSP.DAYS]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"unknown day: {', '.join(unknown)}")
+    return int(week), days
+
+
+def parse_subject_start(text):
+    subject_id, _, week = text.rpartition(':')
+    if not subject_id:
+        raise argparse.ArgumentTypeError('expected SUBJECT_ID:WEEK')
+    return subject_id, int(week)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='CSP timetable for a whole semester')
+    parser.add_argument('--data-dir', default=CSP.DATA_DIR, help='directory with the input CSV files')
+    parser.add_argument('--weeks', type=int, default=16, help='calendar weeks in the semester')
+    parser.add_argument('--holiday', type=parse_holiday, action='append', default=[],
+                        help='WEEK or WEEK:DAY[,DAY...] without lessons; may be repeated')
+    parser.add_argument('--subject-start', type=parse_subject_start, action='append', default=[],
+                        help='SUBJECT_ID:WEEK of a subject starting mid-term; may be repeated')
+    export.add_arguments(parser)
+    args = parser.parse_args()
+    export.check_arguments(parser, args)
+
+    holidays = {}
+    for week, days in args.holiday:
+        holidays.setdefault(week, set()).update(days)
+    calendar = Calendar(args.weeks, holidays, dict(args.subject_start))
+
+    auditoriums, groups, lecturers, subjects = CSP.load_data(args.data_dir)
+    unknown = sorted(set(calendar.subject_starts) - set(subject.id for subject in subjects))
+    if unknown:
+        parser.error(f"--subject-start: unknown subject id {', '.join(unknown)}")
+    lessons = CSP.generate_lessons(subjects, groups)
+    domains = CSP.create_domains(lessons, lecturers, auditoriums)
+    weeks, report = solve_horizon(calendar, subjects, lessons, domains, lecturers, auditoriums)
+
+    if args.export:
+        export.export(export.placements_from_horizon([(week, solution) for week, solution in weeks if solution is not None],
+                                                     lessons, lecturers, auditoriums),
+                      args.export, args.output, args.view, args.term_start)
+    # With the timetable on stdout the report goes to stderr
+    with contextlib.redirect_stdout(sys.stderr if args.export and args.output == '-' else sys.stdout):
+        print_report(report, groups, lecturers)
+        print(f"\n{args.weeks} weeks, {len(report)} distinct week patterns solved")
+    infeasible = [week for week, solution in weeks if solution is None]
+    if infeasible:
+        print(f"No timetable satisfies the hard constraints in weeks: {', '.join(map(str, infeasible))}",
+              file=sys.stderr)
+        sys.exit(1)
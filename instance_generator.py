@@ -0,0 +1,132 @@
+import csv
+import os
+import math
+import random
+import argparse
+
+# Generator of synthetic input data (auditoriums/groups/lecturers/subjects CSVs)
+# in the same format as the files read by CSP.py and test_lab.py.
+
+SLOTS_PER_WEEK = 20  # 5 days x 4 periods, as TIME_SLOTS in CSP.py and test_lab.py
+SMALL_CAPACITY = 30
+LARGE_CAPACITY = 60
+
+GROUP_PREFIXES = ['TTP', 'TK', 'MI', 'KN', 'IPZ', 'SA', 'PM', 'KB']
+SUBJECT_NAMES = [
+    'Теорія прийняття рішень', 'Розробка ПЗ під мобільні', 'Інтелектуальні системи',
+    'Статистичне моделювання', 'Бази даних', 'Комп\'ютерні мережі', 'Операційні системи',
+    'Математичний аналіз', 'Дискретна математика', 'Теорія ймовірностей', 'Машинне навчання',
+    'Алгоритми та структури даних', 'Системне програмування', 'Веб-технології', 'Криптографія'
+]
+SURNAMES = [
+    'Іваненко', 'Петренко', 'Сидоренко', 'Ткаченко', 'Мащенко', 'Зінько', 'Свистунов', 'Коваленко',
+    'Бондаренко', 'Шевченко', 'Кравченко', 'Олійник', 'Поліщук', 'Мельник', 'Лисенко', 'Гончаренко'
+]
+INITIALS = 'АБВГДІКЛМНОПСТ'
+
+
+def generate_instance(num_groups, seed=0, room_slack=0.5, lecturer_slack=0.5):
+    # Returns rows for the four CSV files.
+    # room_slack / lecturer_slack: spare share of auditorium slots / lecturer hours over the weekly demand
+    # (0 - exactly enough, 1 - twice as much).
+    rng = random.Random(seed)
+    groups = []
+    subjects = []
+    for i in range(num_groups):
+        group_number = f"{GROUP_PREFIXES[i % len(GROUP_PREFIXES)]}-{i // len(GROUP_PREFIXES) + 41}"
+        size = rng.randint(20, 32)
+        subgroups = ['1', '2'] if rng.random() < 0.7 else []
+        groups.append((group_number, size, subgroups))
+        for subject_name in rng.sample(SUBJECT_NAMES, rng.randint(3, 4)):
+            subjects.append({
+                'id': f"S{len(subjects) + 1}",
+                'name': subject_name,
+                'group': group_number,
+                'subgroups': subgroups,
+                'num_lectures': rng.randint(1, 2),
+                'num_practicals': rng.randint(1, 2),
+                'requires_subgroups': bool(subgroups) and rng.random() < 0.7
+            })
+
+    # Weekly lessons per subject and type, counted the way the solvers generate them
+    demand = {'Лекція': [], 'Практика': []}
+    whole_group_lessons = 0
+    subgroup_lessons = 0
+    for subject in subjects:
+        demand['Лекція'].append((subject['id'], subject['num_lectures']))
+        whole_group_lessons += subject['num_lectures']
+        if subject['requires_subgroups']:
+            per_subgroup = math.ceil(subject['num_practicals'] / len(subject['subgroups']))
+            practicals = per_subgroup * len(subject['subgroups'])
+            subgroup_lessons += practicals
+        else:
+            practicals = subject['num_practicals']
+            whole_group_lessons += practicals
+        demand['Практика'].append((subject['id'], practicals))
+
+    # Lecturers: pack subjects of one lesson type into lecturers, filling each only to
+    # max_hours / (1 + lecturer_slack), so the spare hours follow the requested slack
+    lecturers = []
+    for lesson_type, items in demand.items():
+        rng.shuffle(items)
+        current = None
+        for subject_id, hours in items:
+            if current is None or current['load'] + hours > current['fill']:
+                max_hours = rng.randint(10, 15)
+                fill = max(1, int(max_hours / (1 + lecturer_slack)))
+                if hours > fill:
+                    max_hours = math.ceil(hours * (1 + lecturer_slack))
+                    fill = hours
+                current = {'subjects': [], 'type': lesson_type, 'max_hours': max_hours, 'fill': fill, 'load': 0}
+                lecturers.append(current)
+            current['subjects'].append(subject_id)
+            current['load'] += hours
+
+    # Auditoriums: large rooms for whole groups, small ones for subgroups,
+    # enough slots for the weekly lessons plus room_slack
+    num_large = max(1, math.ceil(whole_group_lessons * (1 + room_slack) / SLOTS_PER_WEEK))
+    num_small = math.ceil(subgroup_lessons * (1 + room_slack) / SLOTS_PER_WEEK)
+    capacities = [LARGE_CAPACITY] * num_large + [SMALL_CAPACITY] * num_small
+    rng.shuffle(capacities)
+
+    auditorium_rows = [[f"A{i + 1}", capacity] for i, capacity in enumerate(capacities)]
+    group_rows = [[number, size, ';'.join(subgroups)] for number, size, subgroups in groups]
+    lecturer_rows = []
+    for i, lecturer in enumerate(lecturers):
+        name = f"{rng.choice(SURNAMES)} {rng.choice(INITIALS)}.{rng.choice(INITIALS)}."
+        lecturer_rows.append([f"L{i + 1}", name, ','.join(lecturer['subjects']), lecturer['type'],
+                              lecturer['max_hours']])
+    subject_rows = [[s['id'], s['name'], s['group'], s['num_lectures'], s['num_practicals'],
+                     'yes' if s['requires_subgroups'] else 'no', 'both'] for s in subjects]
+    return {
+        'auditoriums.csv': (['auditoriumID', 'capacity'], auditorium_rows),
+        'groups.csv': (['groupNumber', 'studentAmount', 'subgroups'], group_rows),
+        'lecturers.csv': (['lecturerID', 'lecturerName', 'subjectsCanTeach', 'typesCanTeach', 'maxHoursPerWeek'],
+                          lecturer_rows),
+        'subjects.csv': (['id', 'name', 'groupID', 'numLectures', 'numPracticals', 'requiresSubgroups', 'weekType'],
+                         subject_rows)
+    }
+
+
+def write_instance(out_dir, num_groups, seed=0, room_slack=0.5, lecturer_slack=0.5):
+    os.makedirs(out_dir, exist_ok=True)
+    for filename, (header, rows) in generate_instance(num_groups, seed, room_slack, lecturer_slack).items():
+        with open(os.path.join(out_dir, filename), 'w', newline='', encoding='utf-8') as csvfile:
+            writer = csv.writer(csvfile, delimiter=';')
+            writer.writerow(header)
+            writer.writerows(rows)
+    return out_dir
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Generate a synthetic timetabling instance')
+    parser.add_argument('out_dir', help='directory to write the four CSV files to')
+    parser.add_argument('--groups', type=int, default=10, help='number of student groups (10 to 1000)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--room-slack', type=float, default=0.5,
+                        help='spare auditorium slots over the weekly demand (0 - none)')
+    parser.add_argument('--lecturer-slack', type=float, default=0.5,
+                        help='spare lecturer hours over the weekly demand (0 - none)')
+    args = parser.parse_args()
+    write_instance(args.out_dir, args.groups, args.seed, args.room_slack, args.lecturer_slack)
+    print(f"Instance with {args.groups} groups written to {args.out_dir}")
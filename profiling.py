@@ -0,0 +1,182 @@
+import os
+import sys
+import time
+import threading
+import tracemalloc
+import contextlib
+from tabulate import tabulate
+
+try:
+    import resource  # Not available on Windows
+except ImportError:
+    resource = None
+
+# Opt-in memory profiling and memory budget of a solver run (CSP.py and test_lab.py).
+# A run is split into phases - load, domain build, search or evolution, evaluation, render.
+# With profiling on, every phase records its peak resident set size (sampled every
+# RSS_SAMPLE_INTERVAL seconds during the phase) and, through tracemalloc, its traced peak
+# and the source lines that allocated the most during the phase.
+# A budget is checked against the current resident set size, independently of profiling:
+# the solvers call check() or over_budget() at points where they can stop or shrink.
+
+RSS_SAMPLE_INTERVAL = 0.005  # Seconds between resident set size samples within a phase
+
+
+class MemoryBudgetExceeded(Exception):
+    pass
+
+
+def _max_rss_mb():
+    # Peak resident set size of the process (ru_maxrss is in kilobytes on Linux, bytes on macOS)
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def current_rss_mb():
+    # Current resident set size. Without /proc (macOS) the peak so far stands in for it: it
+    # over-estimates, but a budget is never silently unchecked. None where neither can be read
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        pass
+    rss = _max_rss_mb()
+    if rss is not None:
+        return rss
+    if tracemalloc.is_tracing():
+        return tracemalloc.get_traced_memory()[0] / (1024 * 1024)
+    return None
+
+
+def peak_rss_mb():
+    # Peak resident set size of the process so far
+    peak = _max_rss_mb()
+    if peak is not None:
+        return peak
+    if tracemalloc.is_tracing():
+        return tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+    return None
+
+
+class _RssSampler(threading.Thread):
+    # Highest resident set size seen between start() and stop()
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.peak = current_rss_mb() or 0
+        self.stopped = threading.Event()
+
+    def _sample(self):
+        rss = current_rss_mb()
+        if rss is not None and rss > self.peak:
+            self.peak = rss
+
+    def run(self):
+        while not self.stopped.wait(RSS_SAMPLE_INTERVAL):
+            self._sample()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        self._sample()
+        return self.peak
+
+
+class MemoryProfile:
+    def __init__(self, enabled=False, budget_mb=None, top=5):
+        self.enabled = enabled
+        self.budget_mb = budget_mb
+        self.top = top  # Allocating source lines reported per phase
+        self.phases = []
+        self.current = None
+        if enabled and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        if budget_mb is not None and current_rss_mb() is None:
+            # No resident size on this platform (Windows): the budget falls back to traced Python memory
+            print('Warning: resident memory size is not available, the memory budget is checked '
+                  'against memory allocated by Python only', file=sys.stderr)
+            tracemalloc.start()
+
+    def _snapshot(self):
+        return tracemalloc.take_snapshot().filter_traces((tracemalloc.Filter(False, tracemalloc.__file__),))
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        previous, self.current = self.current, name
+        if not self.enabled:
+            try:
+                yield
+            finally:
+                self.current = previous
+            return
+        before = self._snapshot()
+        tracemalloc.reset_peak()
+        sampler = _RssSampler()
+        sampler.start()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            # Before the closing snapshot, which allocates itself
+            phase_peak_rss = sampler.stop()
+            end_rss = current_rss_mb()
+            if end_rss is not None:
+                phase_peak_rss = max(phase_peak_rss, end_rss)
+            traced_peak = tracemalloc.get_traced_memory()[1]
+            growth = self._snapshot().compare_to(before, 'lineno')
+            self.phases.append({
+                'phase': name,
+                'time': elapsed,
+                'traced_peak_mb': traced_peak / (1024 * 1024),
+                'rss_mb': end_rss,
+                'peak_rss_mb': phase_peak_rss,
+                'top': [(str(stat.traceback[0]), stat.size_diff / 1024, stat.count_diff)
+                        for stat in growth[:self.top] if stat.size_diff > 0]
+            })
+            self.current = previous
+
+    def over_budget(self):
+        if self.budget_mb is None:
+            return False
+        rss = current_rss_mb()
+        return rss is not None and rss > self.budget_mb
+
+    def check(self):
+        # Abort the current phase when the process is over the budget
+        if self.over_budget():
+            raise MemoryBudgetExceeded(f"{current_rss_mb():.1f} MB resident is over the budget of "
+                                       f"{self.budget_mb} MB during {self.current or 'the run'}")
+
+    def report(self, out=sys.stderr):
+        if not self.enabled:
+            return
+        headers = ['Phase', 'Time, s', 'Traced peak, MB', 'RSS at end, MB', 'Peak RSS in phase, MB']
+        table = [[entry['phase'], f"{entry['time']:.3f}", f"{entry['traced_peak_mb']:.2f}",
+                  '' if entry['rss_mb'] is None else f"{entry['rss_mb']:.1f}",
+                  f"{entry['peak_rss_mb']:.1f}"]
+                 for entry in self.phases]
+        print('\nMemory profile (times include tracemalloc overhead):', file=out)
+        print(tabulate(table, headers=headers, tablefmt="grid", stralign="center"), file=out)
+        process_peak = peak_rss_mb()
+        if process_peak is not None:
+            print(f"Process peak RSS: {process_peak:.1f} MB", file=out)
+        for entry in self.phases:
+            if entry['top']:
+                print(f"\nTop allocations - {entry['phase']}:", file=out)
+                for line, size_kb, count in entry['top']:
+                    print(f"  {size_kb:10.1f} KiB {count:8d} blocks  {line}", file=out)
+
+
+def add_arguments(parser):
+    # Profiling options shared by CSP.py and test_lab.py
+    parser.add_argument('--profile-memory', action='store_true',
+                        help='report peak memory and top allocating lines per phase to stderr')
+    parser.add_argument('--profile-top', type=int, default=5, help='allocating lines reported per phase')
+    parser.add_argument('--memory-budget', type=float, metavar='MB',
+                        help='resident memory limit; the run degrades or stops when it is exceeded')
+
+
+def from_args(args):
+    return MemoryProfile(args.profile_memory, args.memory_budget, args.profile_top)
@@ -0,0 +1,365 @@
+import io
+import os
+import re
+import sys
+import json
+import time
+import random
+import shutil
+import hashlib
+import tempfile
+import argparse
+import threading
+import contextlib
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import constraints
+
+# Local batch scheduling service (standard library only).
+# Instances are submitted over HTTP as the four CSV files or as a data directory on this host,
+# queued, and solved by a bounded pool of worker processes with the CSP or the GA engine.
+#
+#   POST /jobs               {"engine": "csp"|"ga", "files": {"auditoriums.csv": "...", ...}}
+#                            or {"engine": ..., "data_dir": "/path"}; optional "format" and "settings"
+#                            (CSP: "constraints" - rules by name, see constraints.default_constraints)
+#   GET  /jobs               all jobs
+#   GET  /jobs/<id>          status, progress and stats of a job
+#   GET  /jobs/<id>/result   the solved timetable in the job's export format
+#   GET  /stats              queue and throughput statistics
+
+DATA_FILES = ['auditoriums.csv', 'groups.csv', 'lecturers.csv', 'subjects.csv']
+ENGINES = ['csp', 'ga']
+FORMATS = ['csv', 'jsonl', 'ics']
+CONTENT_TYPES = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson', 'ics': 'text/calendar'}
+GA_DEFAULTS = {'population': 50, 'generations': 100, 'seed_rate': 0.2, 'memetic': False}
+MAX_PENDING_JOBS = 1000  # Submissions beyond this are refused with 503
+CACHE_SIZE = 8  # Parsed instances kept warm in every worker process
+
+
+# Worker side: runs in the pool processes
+
+_instance_cache = OrderedDict()  # (engine, instance_key) -> parsed and compiled data
+
+
+def _load_instance(engine, instance_key, data_dir):
+    # Parsed reference data is reused by later jobs on the same instance in this worker
+    cache_key = (engine, instance_key)
+    if cache_key in _instance_cache:
+        _instance_cache.move_to_end(cache_key)
+        return _instance_cache[cache_key], True
+    if engine == 'csp':
+        import CSP
+        auditoriums, groups, lecturers, subjects = CSP.load_data(data_dir)
+        lessons = CSP.generate_lessons(subjects, groups)
+        domains = CSP.create_domains(lessons, lecturers, auditoriums)
+        loaded = (auditoriums, groups, lecturers, subjects, lessons, domains)
+    else:
+        import test_lab
+        data = test_lab.load_data(data_dir)
+        loaded = (data, test_lab.instance)
+    _instance_cache[cache_key] = loaded
+    if len(_instance_cache) > CACHE_SIZE:
+        _instance_cache.popitem(last=False)
+    return loaded, False
+
+
+def _solve_csp(job_id, loaded, settings, result_path, fmt, progress):
+    import CSP
+    import export
+    auditoriums, groups, lecturers, subjects, lessons, domains = loaded
+    csp = CSP.CSP(variables=lessons, domains=domains, lecturers=lecturers, auditoriums=auditoriums,
+                  constraints=constraints.default_constraints(settings.get('constraints', [])))
+    csp.on_progress = lambda nodes, assigned: progress.put(
+        (job_id, 'progress', {'nodes': nodes, 'assigned': assigned, 'lessons': len(lessons)}))
+    solution = csp.solve()
+    stats = {'lessons': len(lessons), 'nodes': csp.nodes, 'solved': bool(solution)}
+    if solution:
+        stats['windows'] = CSP.calculate_fitness(solution, lessons, groups, lecturers)
+        export.export(export.placements_from_csp(solution, lessons, lecturers, auditoriums), fmt, result_path)
+    return stats
+
+
+def _solve_ga(job_id, loaded, settings, result_path, fmt, progress):
+    import test_lab
+    import export
+    data, compiled_instance = loaded
+    test_lab.use_data(data, compiled_instance)
+    test_lab.POPULATION_SIZE = settings['population']
+    test_lab.GENERATIONS = settings['generations']
+    evaluations_before = test_lab.fitness_evaluations
+    best_schedule = test_lab.genetic_algorithm(
+        seed_rate=settings['seed_rate'], memetic=settings['memetic'],
+        on_generation=lambda generation, best_fitness: progress.put(
+            (job_id, 'progress', {'generation': generation, 'generations': settings['generations'],
+                                  'best_fitness': best_fitness})))
+    export.export(export.placements_from_schedule(best_schedule, test_lab.TIME_SLOTS), fmt, result_path)
+    return {
+        'lessons': len(compiled_instance.lesson_templates),
+        'generations': test_lab.generations_run,
+        'fitness_evaluations': test_lab.fitness_evaluations - evaluations_before,
+        'fitness': best_schedule.fitness,
+        'solved': True
+    }
+
+
+def run_job(job_id, engine, data_dir, instance_key, settings, result_path, fmt, progress):
+    progress.put((job_id, 'running', {'worker': os.getpid()}))
+    random.seed(settings.get('seed', 0))
+    start = time.perf_counter()
+    # The solvers print progress and timetables; the service reports through the progress queue instead
+    with contextlib.redirect_stdout(io.StringIO()):
+        loaded, cache_hit = _load_instance(engine, instance_key, data_dir)
+        load_time = time.perf_counter() - start
+        solve = _solve_csp if engine == 'csp' else _solve_ga
+        stats = solve(job_id, loaded, settings, result_path, fmt, progress)
+    stats.update({'load_time': load_time, 'run_time': time.perf_counter() - start,
+                  'cache_hit': cache_hit, 'worker': os.getpid()})
+    return stats
+
+
+# Service side: job bookkeeping and HTTP front end
+
+class SchedulingService:
+    def __init__(self, workers, spool_dir):
+        self.workers = workers
+        self.spool_dir = spool_dir
+        self.jobs = OrderedDict()  # job id -> job dict
+        self.lock = threading.Lock()
+        self.next_id = 1
+        self.started = time.time()
+        self.context = multiprocessing.get_context('spawn')
+        self.manager = self.context.Manager()
+        self.progress = self.manager.Queue()
+        self.executor = ProcessPoolExecutor(max_workers=workers, mp_context=self.context)
+        threading.Thread(target=self._collect_progress, daemon=True).start()
+
+    def _collect_progress(self):
+        while True:
+            message = self.progress.get()
+            if message is None:
+                return
+            job_id, kind, data = message
+            with self.lock:
+                job = self.jobs.get(job_id)
+                if not job:
+                    continue
+                if kind == 'running' and job['status'] == 'queued':
+                    job['status'] = 'running'
+                    job['started'] = time.time()
+                job['progress'].update(data)
+
+    def submit(self, request):
+        engine = request.get('engine', 'csp')
+        if engine not in ENGINES:
+            raise ValueError(f"engine must be one of {ENGINES}")
+        fmt = request.get('format', 'jsonl')
+        if fmt not in FORMATS:
+            raise ValueError(f"format must be one of {FORMATS}")
+        settings = dict(GA_DEFAULTS)
+        settings.update(request.get('settings', {}))
+        if engine == 'csp':
+            constraints.build(settings.get('constraints', []))  # Unknown names or arguments are rejected here
+        # Validate the data before a job id and a spool directory are reserved for it.
+        # The instance key identifies identical data, so warm workers can skip parsing it again
+        digest = hashlib.sha256()
+        if 'files' in request:
+            files = request['files']
+            for filename in DATA_FILES:
+                if not isinstance(files, dict) or filename not in files:
+                    raise ValueError(f"missing file {filename}")
+                if not isinstance(files[filename], str):
+                    raise ValueError(f"file {filename} must be a string")
+                digest.update(files[filename].encode('utf-8'))
+        elif 'data_dir' in request:
+            data_dir = request['data_dir']
+            for filename in DATA_FILES:
+                path = os.path.join(data_dir, filename)
+                if not os.path.isfile(path):
+                    raise ValueError(f"missing file {path}")
+                with open(path, 'rb') as f:
+                    digest.update(f.read())
+        else:
+            raise ValueError("request needs 'files' or 'data_dir'")
+        with self.lock:
+            pending = sum(1 for job in self.jobs.values() if job['status'] in ('queued', 'running'))
+            if pending >= MAX_PENDING_JOBS:
+                raise OverflowError('too many pending jobs')
+            job_id = str(self.next_id)
+            self.next_id += 1
+        job_dir = os.path.join(self.spool_dir, job_id)
+        os.makedirs(job_dir)
+        if 'files' in request:
+            data_dir = job_dir
+            for filename in DATA_FILES:
+                with open(os.path.join(job_dir, filename), 'w', newline='', encoding='utf-8') as f:
+                    f.write(request['files'][filename])
+        result_path = os.path.join(job_dir, f"result.{fmt}")
+        job = {'id': job_id, 'engine': engine, 'format': fmt, 'settings': settings, 'status': 'queued',
+               'submitted': time.time(), 'started': None, 'finished': None, 'progress': {}, 'stats': {},
+               'error': None, 'result_path': result_path}
+        # The job is listed only once the pool has accepted it; under the lock, so its first
+        # progress message cannot arrive before it is listed
+        with self.lock:
+            try:
+                future = self._submit_to_pool(job_id, engine, data_dir, digest.hexdigest(), settings,
+                                              result_path, fmt, self.progress)
+            except Exception as e:
+                shutil.rmtree(job_dir, ignore_errors=True)
+                raise RuntimeError(f"worker pool unavailable: {type(e).__name__}: {e}") from e
+            self.jobs[job_id] = job
+        future.add_done_callback(lambda f: self._finish(job_id, f))
+        return self.describe(job_id)
+
+    def _submit_to_pool(self, *args):
+        # A worker that died (e.g. killed by the OOM killer) breaks the whole pool for good.
+        # Replace the pool once and resubmit; jobs that were running on the old pool fail
+        try:
+            return self.executor.submit(run_job, *args)
+        except BrokenProcessPool:
+            print('Worker pool broken, starting a new one', file=sys.stderr)
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=self.context)
+            return self.executor.submit(run_job, *args)
+
+    def _finish(self, job_id, future):
+        with self.lock:
+            job = self.jobs[job_id]
+            job['finished'] = time.time()
+            job['started'] = job['started'] or job['finished']
+            try:
+                job['stats'] = future.result()
+                job['status'] = 'done' if job['stats'].get('solved') else 'no solution'
+            except Exception as e:
+                job['status'] = 'failed'
+                job['error'] = f"{type(e).__name__}: {e}"
+            job['stats']['queue_time'] = job['started'] - job['submitted']
+
+    def describe(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if not job:
+                return None
+            return {key: value for key, value in job.items() if key != 'result_path'}
+
+    def list_jobs(self):
+        with self.lock:
+            job_ids = list(self.jobs)
+        return [self.describe(job_id) for job_id in job_ids]
+
+    def result_path(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if not job or job['status'] != 'done':
+                return None, job
+            return job['result_path'], job
+
+    def stats(self):
+        with self.lock:
+            statuses = [job['status'] for job in self.jobs.values()]
+            finished = [job for job in self.jobs.values() if job['finished']]
+        uptime = time.time() - self.started
+        return {
+            'workers': self.workers,
+            'queued': statuses.count('queued'),
+            'running': statuses.count('running'),
+            'done': statuses.count('done'),
+            'no_solution': statuses.count('no solution'),
+            'failed': statuses.count('failed'),
+            'uptime': uptime,
+            'jobs_per_minute': len(finished) / uptime * 60 if uptime else 0,
+            'mean_run_time': (sum(job['stats'].get('run_time', 0) for job in finished) / len(finished)
+                              if finished else None)
+        }
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.progress.put(None)
+        self.manager.shutdown()
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    def _send_json(self, status, body):
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        service = self.server.service
+        if self.path == '/jobs':
+            return self._send_json(200, service.list_jobs())
+        if self.path == '/stats':
+            return self._send_json(200, service.stats())
+        match = re.fullmatch(r'/jobs/(\w+)(/result)?', self.path)
+        if not match:
+            return self._send_json(404, {'error': 'not found'})
+        job_id, result = match.groups()
+        if not result:
+            job = service.describe(job_id)
+            return self._send_json(200, job) if job else self._send_json(404, {'error': 'unknown job'})
+        path, job = service.result_path(job_id)
+        if not job:
+            return self._send_json(404, {'error': 'unknown job'})
+        if not path:
+            return self._send_json(409, {'error': f"job is {job['status']}"})
+        # Stream the result file in chunks
+        self.send_response(200)
+        self.send_header('Content-Type', f"{CONTENT_TYPES[job['format']]}; charset=utf-8")
+        self.send_header('Content-Length', str(os.path.getsize(path)))
+        self.end_headers()
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(64 * 1024)
+                if not chunk:
+                    break
+                self.wfile.write(chunk)
+
+    def do_POST(self):
+        if self.path != '/jobs':
+            return self._send_json(404, {'error': 'not found'})
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length).decode('utf-8'))
+            return self._send_json(202, self.server.service.submit(request))
+        except OverflowError as e:
+            return self._send_json(503, {'error': str(e)})
+        except (ValueError, TypeError, AttributeError) as e:
+            return self._send_json(400, {'error': str(e)})
+        except Exception as e:
+            return self._send_json(500, {'error': f"{type(e).__name__}: {e}"})
+
+    def log_message(self, format, *args):
+        print(f"{self.address_string()} - {format % args}", file=sys.stderr)
+
+
+def serve(host, port, workers, spool_dir):
+    service = SchedulingService(workers, spool_dir)
+    server = ThreadingHTTPServer((host, port), RequestHandler)
+    server.service = service
+    print(f"Scheduling service on http://{host}:{server.server_address[1]} "
+          f"with {workers} workers, spool {spool_dir}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Local batch scheduling service')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='solver processes')
+    parser.add_argument('--spool-dir', help='directory for submitted instances and results (default: temporary)')
+    args = parser.parse_args()
+    spool_dir = args.spool_dir or tempfile.mkdtemp(prefix='timetable-jobs-')
+    os.makedirs(spool_dir, exist_ok=True)
+    serve(args.host, args.port, args.workers, spool_dir)
@@ -1,7 +1,17 @@
 import csv
 import random
 import copy
+import heapq
+import os
+import pickle
+import argparse
+import contextlib
+import sys
+from collections import defaultdict
 from tabulate import tabulate
+import evaluation
+import export
+import profiling
 import re  # Importing the 're' module
 import math  # Importing the 'math' module
 
@@ -83,22 +93,6 @@ def read_subjects(filename):
             ))
     return subjects
 
-# Loading data
-auditoriums = read_auditoriums('../IS_lab_4_basedOn3/auditoriums.csv')
-groups = read_groups('groups.csv')
-lecturers = read_lecturers('lecturers.csv')
-subjects = read_subjects('subjects.csv')
-
-# Checking that each subject has at least one lecturer
-subject_ids = set(subject.id for subject in subjects)
-lecturer_subjects = set()
-for lecturer in lecturers:
-    lecturer_subjects.update(lecturer.subjects_can_teach)
-
-missing_subjects = subject_ids - lecturer_subjects
-if missing_subjects:
-    print(f"Warning: No lecturers available for the following subjects: {', '.join(missing_subjects)}")
-
 # Defining time slots: 5 days, 4 periods per day
 DAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday']
 PERIODS = ['1', '2', '3', '4']  # Periods per day
@@ -114,6 +108,145 @@ class Lesson:
         self.auditorium = None
         self.lecturer = None
 
+    def copy(self):
+        # Lessons only reference shared input data, so a shallow copy is an independent lesson
+        return copy.copy(self)
+
+    def eligibility_key(self):
+        return (self.subject.id, self.type, self.subgroup)
+
+class CompiledInstance:
+    # Everything the GA operators need that depends only on the input data.
+    # Built once, so creating or mutating a schedule never rescans lecturers or auditoriums.
+    def __init__(self, subjects, groups, lecturers, auditoriums):
+        self.groups_by_number = {group.number: group for group in groups}
+        self.evaluator = evaluation.Evaluator(groups, lecturers, DAYS, PERIODS)
+        # Canonical list of lessons to schedule: (subject, type, group, subgroup)
+        self.lesson_templates = []
+        # Key: (subject.id, type), Value: list of (subject, type, group, subgroup) added together by mutation
+        self.lesson_variants = {}
+        # Key: (subject.id, type, subgroup), Value: list of lecturers / auditoriums allowed for the lesson
+        self.eligible_lecturers = {}
+        self.eligible_auditoriums = {}
+        # Hours every subject needs (soft constraint):
+        # (subject.id, group.number, subgroups, required lectures, required practicals per subgroup)
+        self.subject_requirements = []
+        for subject in subjects:
+            group = self.groups_by_number.get(subject.group_id)
+            if not group:
+                continue
+            self.subject_requirements.append((subject.id, group.number,
+                                              group.subgroups if subject.requires_subgroups else [None],
+                                              subject.num_lectures, subject.num_practicals))
+            # Lectures
+            for _ in range(subject.num_lectures):
+                self.lesson_templates.append((subject, 'Лекція', group, None))
+            # Practicals
+            if subject.requires_subgroups and group.subgroups:
+                num_practicals_per_subgroup = math.ceil(subject.num_practicals / len(group.subgroups))
+                for subgroup in group.subgroups:
+                    for _ in range(num_practicals_per_subgroup):
+                        self.lesson_templates.append((subject, 'Практика', group, subgroup))
+            else:
+                for _ in range(subject.num_practicals):
+                    self.lesson_templates.append((subject, 'Практика', group, None))
+            # Variants used by add_random_lesson, whether or not the subject requires that type
+            self.lesson_variants[(subject.id, 'Лекція')] = [(subject, 'Лекція', group, None)]
+            if subject.requires_subgroups and group.subgroups:
+                self.lesson_variants[(subject.id, 'Практика')] = [
+                    (subject, 'Практика', group, subgroup) for subgroup in group.subgroups
+                ]
+            else:
+                self.lesson_variants[(subject.id, 'Практика')] = [(subject, 'Практика', group, None)]
+            for variants in (self.lesson_variants[(subject.id, 'Лекція')],
+                             self.lesson_variants[(subject.id, 'Практика')]):
+                for variant in variants:
+                    self._compile_eligibility(variant, lecturers, auditoriums)
+
+    def _compile_eligibility(self, template, lecturers, auditoriums):
+        subject, lesson_type, group, subgroup = template
+        key = (subject.id, lesson_type, subgroup)
+        if key in self.eligible_lecturers:
+            return
+        # Matching lecturers by subject.id and lesson type (hard constraint)
+        possible = [lecturer for lecturer in lecturers if
+                    subject.id in lecturer.subjects_can_teach and
+                    lesson_type in lecturer.types_can_teach]
+        if not possible:
+            print(f"No lecturer available for {subject.name} ({lesson_type}) with subject ID {subject.id}.",
+                  file=sys.stderr)
+        if subgroup:
+            students = group.size // len(group.subgroups)
+        else:
+            students = group.size
+        self.eligible_lecturers[key] = possible
+        self.eligible_auditoriums[key] = [aud for aud in auditoriums if aud.capacity >= students]
+
+    def new_lessons(self, templates=None):
+        # Fresh, unassigned Lesson objects for the given templates (all lessons by default)
+        if templates is None:
+            templates = self.lesson_templates
+        return [Lesson(subject, lesson_type, group, subgroup)
+                for subject, lesson_type, group, subgroup in templates]
+
+    def domain_size(self, lesson):
+        # Lecturer/auditorium combinations available to the lesson (time slots are the same for all)
+        key = lesson.eligibility_key()
+        return len(self.eligible_lecturers.get(key, [])) * len(self.eligible_auditoriums.get(key, []))
+
+    def assign_resources(self, lesson):
+        # Pick a random eligible lecturer and auditorium; False if the lesson cannot be staffed or housed
+        possible_lecturers = self.eligible_lecturers.get(lesson.eligibility_key())
+        suitable_auditoriums = self.eligible_auditoriums.get(lesson.eligibility_key())
+        if not possible_lecturers or not suitable_auditoriums:
+            return False
+        lesson.lecturer = random.choice(possible_lecturers)
+        lesson.auditorium = random.choice(suitable_auditoriums)
+        return True
+
+# Loading data (by default the CSV files next to this script)
+DATA_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def read_data(data_dir=DATA_DIR):
+    # Parse the input CSV files without making them the GA's data
+    return (read_auditoriums(os.path.join(data_dir, 'auditoriums.csv')),
+            read_groups(os.path.join(data_dir, 'groups.csv')),
+            read_lecturers(os.path.join(data_dir, 'lecturers.csv')),
+            read_subjects(os.path.join(data_dir, 'subjects.csv')))
+
+def load_data(data_dir=DATA_DIR):
+    # (Re)load the input data; the GA always works on the data loaded last
+    data = read_data(data_dir)
+    use_data(data)
+    return data
+
+def use_data(data, compiled_instance=None):
+    # Make already parsed data (and optionally its compiled instance) the data the GA works on
+    global auditoriums, groups, lecturers, subjects, instance
+    auditoriums, groups, lecturers, subjects = data
+
+    # Checking that each subject has at least one lecturer
+    subject_ids = set(subject.id for subject in subjects)
+    lecturer_subjects = set()
+    for lecturer in lecturers:
+        lecturer_subjects.update(lecturer.subjects_can_teach)
+
+    missing_subjects = subject_ids - lecturer_subjects
+    if missing_subjects:
+        print(f"Warning: No lecturers available for the following subjects: {', '.join(missing_subjects)}",
+              file=sys.stderr)
+
+    instance = compiled_instance or CompiledInstance(subjects, groups, lecturers, auditoriums)
+
+# The data the GA works on, set by load_data or use_data. Nothing is loaded at import,
+# so importing the module (e.g. in service or benchmark workers) does not need the CSV files here
+auditoriums = groups = lecturers = subjects = instance = None
+
+# Number of full fitness evaluations, to compare how much work different GA settings need
+fitness_evaluations = 0
+# Generations evolved by the last genetic_algorithm run
+generations_run = 0
+
 class Schedule:
     def __init__(self):
         # Key: time_slot (day, period), Value: list of lessons at that time
@@ -122,97 +255,47 @@ class Schedule:
         self.fitness = None  # To be calculated
 
     def calculate_fitness(self):
-        penalty = 0
-        # Fitness for even week
-        penalty += self._calculate_fitness_for_week(self.even_timetable)
-        # Fitness for odd week
-        penalty += self._calculate_fitness_for_week(self.odd_timetable)
-        # Soft constraints for subjects
-        penalty += self._calculate_soft_constraints()
-        if penalty < 0:
-            penalty = 0
-        self.fitness = 1 / (1 + penalty)
-
-    def _calculate_fitness_for_week(self, timetable):
-        penalty = 0
-        # Minimize gaps in the schedule for groups (soft constraint)
-        for group in groups:
-            subgroups = group.subgroups if group.subgroups else [None]
-            for subgroup in subgroups:
-                schedule_list = []
-                for time_slot, lessons in timetable.items():
-                    for lesson in lessons:
-                        if lesson.group.number == group.number and lesson.subgroup == subgroup:
-                            schedule_list.append(time_slot)
-                schedule_sorted = sorted(schedule_list, key=lambda x: (DAYS.index(x[0]), int(x[1])))
-                for i in range(len(schedule_sorted) - 1):
-                    day1, period1 = schedule_sorted[i]
-                    day2, period2 = schedule_sorted[i + 1]
-                    if day1 == day2:
-                        gaps = int(period2) - int(period1) - 1
-                        if gaps > 0:
-                            penalty += gaps
-        # Minimize gaps in the schedule for lecturers (soft constraint)
-        for lecturer in lecturers:
-            schedule_list = []
-            for time_slot, lessons in timetable.items():
-                for lesson in lessons:
-                    if lesson.lecturer and lesson.lecturer.id == lecturer.id:
-                        schedule_list.append(time_slot)
-            schedule_sorted = sorted(schedule_list, key=lambda x: (DAYS.index(x[0]), int(x[1])))
-            for i in range(len(schedule_sorted) - 1):
-                day1, period1 = schedule_sorted[i]
-                day2, period2 = schedule_sorted[i + 1]
-                if day1 == day2:
-                    gaps = int(period2) - int(period1) - 1
-                    if gaps > 0:
-                        penalty += gaps
-            # Balancing lecturer workload (soft constraint)
-            hours_assigned = len(schedule_list)
-            max_hours = lecturer.max_hours_per_week
-            if hours_assigned > max_hours:
-                penalty += (hours_assigned - max_hours) * 2  # Penalty for exceeding
-        return penalty
+        evaluate_schedules([self])
 
     def _calculate_soft_constraints(self):
+        # Penalties for not meeting or exceeding the required number of hours per subject (soft constraint).
+        # Lessons are counted in one pass over both weeks, then compared with the compiled requirements
+        lectures = defaultdict(int)  # (subject.id, group.number) -> scheduled lectures
+        practicals = defaultdict(int)  # (subject.id, group.number, subgroup) -> scheduled practicals
+        for timetable in (self.even_timetable, self.odd_timetable):
+            for lessons in timetable.values():
+                for lesson in lessons:
+                    if lesson.type == 'Лекція':
+                        lectures[(lesson.subject.id, lesson.group.number)] += 1
+                    elif lesson.type == 'Практика':
+                        practicals[(lesson.subject.id, lesson.group.number, lesson.subgroup)] += 1
         penalty = 0
-        # Adding penalties for not meeting or exceeding the required number of hours per subject (soft constraint)
-        for subject in subjects:
-            group = next((g for g in groups if g.number == subject.group_id), None)
-            if not group:
-                continue
-            subgroups = group.subgroups if subject.requires_subgroups else [None]
-            scheduled_lectures = 0
-            scheduled_practicals = {s: 0 for s in subgroups}
-            required_lectures = subject.num_lectures
-            required_practicals = subject.num_practicals
-            for subgroup in subgroups:
-                for timetable in [self.even_timetable, self.odd_timetable]:
-                    for time_slot, lessons in timetable.items():
-                        for lesson in lessons:
-                            if lesson.type == 'Лекція' and lesson.subject.id == subject.id \
-                                    and lesson.group.number == group.number:
-                                scheduled_lectures += 1
-                            elif lesson.type == 'Практика' and lesson.subject.id == subject.id \
-                                    and lesson.group.number == group.number and lesson.subgroup == subgroup:
-                                scheduled_practicals[subgroup] += 1
-
-            # Calculating the difference between scheduled and required hours
-            diff_lectures = scheduled_lectures - required_lectures
-            diff_practicals = [abs(practical - required_practicals) for _, practical in scheduled_practicals.items()]
-            penalty += abs(diff_lectures) * 2
-            penalty += sum(diff_practicals) * 2
+        for subject_id, group_number, subgroups, required_lectures, required_practicals in \
+                instance.subject_requirements:
+            # Lectures are counted once per subgroup, as the per-subgroup scan always counted them
+            scheduled_lectures = lectures.get((subject_id, group_number), 0) * len(subgroups)
+            penalty += abs(scheduled_lectures - required_lectures) * 2
+            penalty += sum(abs(practicals.get((subject_id, group_number, subgroup), 0) - required_practicals)
+                           for subgroup in set(subgroups)) * 2
         return penalty
 
 
-def get_possible_lecturers(lesson):
-    # Matching lecturers by subject.id and lesson type (hard constraint)
-    possible = [lecturer for lecturer in lecturers if
-                lesson.subject.id in lecturer.subjects_can_teach and
-                lesson.type in lecturer.types_can_teach]
-    if not possible:
-        print(f"No lecturer available for {lesson.subject.name} ({lesson.type}) with subject ID {lesson.subject.id}.")
-    return possible
+def evaluate_schedules(schedules):
+    # Fitness of many schedules with one vectorized evaluator call; a single numpy call per schedule
+    # costs more than the Python loops it replaced on small instances, a batch per generation does not
+    global fitness_evaluations
+    if not schedules:
+        return
+    fitness_evaluations += len(schedules)
+    # Gaps of groups and lecturers and lecturer overload in both weeks (soft constraints)
+    penalties = instance.evaluator.evaluate_many(
+        [evaluation.placements_from_schedule(schedule) for schedule in schedules])['penalty']
+    for schedule, penalty in zip(schedules, penalties):
+        # Soft constraints for subjects
+        penalty = penalty.item() + schedule._calculate_soft_constraints()
+        if penalty < 0:
+            penalty = 0
+        schedule.fitness = 1 / (1 + penalty)
 
 def is_conflict(lesson, time_slot, timetable):
     for existing_lesson in timetable[time_slot]:
@@ -234,51 +317,126 @@ def is_conflict(lesson, time_slot, timetable):
 # Genetic algorithm settings
 POPULATION_SIZE = 50
 GENERATIONS = 100
-
-def create_initial_population():
+MIN_POPULATION_SIZE = 10  # Smallest population the memory budget may shrink it to
+REDUCED_RSS_MARGIN = 0.02  # Growth after a population reduction, as a share of the budget, that counts as new growth
+ELITE_RATE = 0.1  # Share of the population carried over unchanged
+TOURNAMENT_SIZE = 3  # Schedules competing for each parent slot
+MUTATION_RATE = 0.1  # Mutation rate of a fully diverse population
+MAX_MUTATION_RATE = 0.4  # Mutation rate of a population of identical schedules
+STAGNATION_WINDOW = 25  # Stop if the best fitness has not improved for this many generations
+STAGNATION_TOLERANCE = 1e-9  # Smallest change of the best fitness counted as an improvement
+CHECKPOINT_INTERVAL = 10  # Save a checkpoint every N generations (when a checkpoint path is given)
+SEED_RATE = 0.2  # Share of the initial population built by construct_schedule instead of at random
+MEMETIC_TOP = 5  # Offspring improved by local search each generation (when the memetic step is on)
+MEMETIC_MOVES = 20  # Maximum lesson moves per local search
+
+def create_initial_population(seed_rate=SEED_RATE, memory=None):
+    # Part of the population starts near-feasible, the rest is random for diversity.
+    # memory - optional profiling.MemoryProfile with a budget, checked after every schedule:
+    # over it the population stays smaller once it has MIN_POPULATION_SIZE schedules, before that the run aborts
+    seeded_count = min(POPULATION_SIZE, int(seed_rate * POPULATION_SIZE))
     population = []
-    for _ in range(POPULATION_SIZE):
-        schedule = Schedule()
-        lessons_to_schedule = []
-        for subject in subjects:
-            group = next((g for g in groups if g.number == subject.group_id), None)
-            if not group:
+    while len(population) < POPULATION_SIZE:
+        if len(population) < seeded_count:
+            population.append(construct_schedule(evaluate=False))
+        else:
+            population.append(random_schedule(evaluate=False))
+        if memory and memory.over_budget():
+            if len(population) < MIN_POPULATION_SIZE:
+                memory.check()
+            print(f'Memory budget exceeded, initial population limited to {len(population)}.')
+            break
+    evaluate_schedules(population)
+    return population
+
+def random_schedule(evaluate=True):
+    schedule = Schedule()
+    lessons_to_schedule = instance.new_lessons()
+    # Randomize the order of lessons
+    random.shuffle(lessons_to_schedule)
+    # Assign lessons; lessons that do not fit are left out and penalized by the fitness function
+    for lesson in lessons_to_schedule:
+        if not instance.assign_resources(lesson):
+            continue
+        assign_randomly(lesson, schedule)
+    if evaluate:
+        schedule.calculate_fitness()
+    return schedule
+
+def _gaps_after_adding(periods, period):
+    # Number of free periods between the first and the last lesson of the day once period is added
+    if not periods:
+        return 0
+    first = min(min(periods), period)
+    last = max(max(periods), period)
+    return (last - first + 1) - (len(periods) + 1)
+
+def construct_schedule(evaluate=True):
+    # Randomized greedy construction in the spirit of the CSP solver:
+    # lessons with the fewest possible values go first (MRV, random tie-break),
+    # and each takes the free slot that adds the fewest gaps for its group and lecturer.
+    schedule = Schedule()
+    timetables = [schedule.even_timetable, schedule.odd_timetable]
+    lessons_to_schedule = instance.new_lessons()
+    random.shuffle(lessons_to_schedule)
+    lessons_to_schedule.sort(key=instance.domain_size)
+    # Occupancy indexes, so a candidate slot is checked without scanning the timetable
+    busy_lecturers = set()  # (week, time_slot, lecturer.id)
+    busy_auditoriums = set()  # (week, time_slot, auditorium.id)
+    group_slots = defaultdict(list)  # (week, time_slot, group.number) -> subgroups (None - whole group)
+    group_periods = defaultdict(list)  # (week, day, group.number, subgroup) -> periods
+    lecturer_periods = defaultdict(list)  # (week, day, lecturer.id) -> periods
+    lecturer_hours = defaultdict(int)  # (week, lecturer.id) -> lessons
+    candidates = [(week, time_slot) for week in range(len(timetables)) for time_slot in TIME_SLOTS]
+    for lesson in lessons_to_schedule:
+        key = lesson.eligibility_key()
+        possible_lecturers = instance.eligible_lecturers.get(key)
+        suitable_auditoriums = instance.eligible_auditoriums.get(key)
+        if not possible_lecturers or not suitable_auditoriums:
+            continue
+        # Random order of lecturers and auditoriums too, so seeded schedules differ in resources, not only slots
+        possible_lecturers = random.sample(possible_lecturers, len(possible_lecturers))
+        suitable_auditoriums = random.sample(suitable_auditoriums, len(suitable_auditoriums))
+        random.shuffle(candidates)
+        best = None
+        best_cost = None
+        for week, time_slot in candidates:
+            taken = group_slots[(week, time_slot, lesson.group.number)]
+            if taken and (lesson.subgroup is None or None in taken or lesson.subgroup in taken):
                 continue
-            # Lectures
-            for _ in range(subject.num_lectures):
-                lessons_to_schedule.append(Lesson(subject, 'Лекція', group))
-            # Practicals
-            if subject.requires_subgroups and group.subgroups:
-                num_practicals_per_subgroup = math.ceil(subject.num_practicals / len(group.subgroups))
-                for subgroup in group.subgroups:
-                    for _ in range(num_practicals_per_subgroup):
-                        lessons_to_schedule.append(Lesson(subject, 'Практика', group, subgroup))
-            else:
-                for _ in range(subject.num_practicals):
-                    lessons_to_schedule.append(Lesson(subject, 'Практика', group))
-        # Randomize the order of lessons
-        random.shuffle(lessons_to_schedule)
-        # Assign lessons
-        for lesson in lessons_to_schedule:
-            possible_lecturers = get_possible_lecturers(lesson)
-            if not possible_lecturers:
+            lecturer = next((l for l in possible_lecturers
+                             if (week, time_slot, l.id) not in busy_lecturers
+                             and lecturer_hours[(week, l.id)] < l.max_hours_per_week), None)
+            if not lecturer:
                 continue
-            lesson.lecturer = random.choice(possible_lecturers)
-            if lesson.subgroup:
-                students = lesson.group.size // len(lesson.group.subgroups)
-            else:
-                students = lesson.group.size
-            suitable_auditoriums = [aud for aud in auditoriums if aud.capacity >= students]
-            if not suitable_auditoriums:
+            auditorium = next((a for a in suitable_auditoriums
+                               if (week, time_slot, a.id) not in busy_auditoriums), None)
+            if not auditorium:
                 continue
-            lesson.auditorium = random.choice(suitable_auditoriums)
-            assigned = assign_randomly(lesson, schedule)
-            if not assigned:
-                # If assignment failed, add penalty
-                schedule.fitness = 0
+            day, period = time_slot
+            period = int(period)
+            cost = (_gaps_after_adding(group_periods[(week, day, lesson.group.number, lesson.subgroup)], period) +
+                    _gaps_after_adding(lecturer_periods[(week, day, lecturer.id)], period))
+            if best_cost is None or cost < best_cost:
+                best = (week, time_slot, lecturer, auditorium)
+                best_cost = cost
+                if cost == 0:
+                    break
+        if not best:
+            continue
+        week, time_slot, lesson.lecturer, lesson.auditorium = best
+        lesson.time_slot = time_slot
+        timetables[week][time_slot].append(lesson)
+        day, period = time_slot
+        busy_lecturers.add((week, time_slot, lesson.lecturer.id))
+        busy_auditoriums.add((week, time_slot, lesson.auditorium.id))
+        group_slots[(week, time_slot, lesson.group.number)].append(lesson.subgroup)
+        group_periods[(week, day, lesson.group.number, lesson.subgroup)].append(int(period))
+        lecturer_periods[(week, day, lesson.lecturer.id)].append(int(period))
+        lecturer_hours[(week, lesson.lecturer.id)] += 1
+    if evaluate:
         schedule.calculate_fitness()
-        population.append(schedule)
-    return population
+    return schedule
 
 def assign_randomly(lesson, schedule):
     timetables = [schedule.even_timetable, schedule.odd_timetable]
@@ -289,20 +447,23 @@ def assign_randomly(lesson, schedule):
         for time_slot in available_time_slots:
             if not is_conflict(lesson, time_slot, timetable):
                 lesson.time_slot = time_slot
-                timetable[time_slot].append(copy.deepcopy(lesson))
+                timetable[time_slot].append(lesson)
                 assigned = True
                 break
         if assigned:
             break
     return assigned
 
-def selection(population):
-    # Select the best schedules based on fitness (elitism)
-    population.sort(key=lambda x: x.fitness, reverse=True)
-    selected = population[:int(0.2 * len(population))]  # Select top 20%
-    return selected
+def select_elites(population, elite_size):
+    # Partial sort: only the top elite_size schedules are ordered (heap-based, no full sort)
+    return heapq.nlargest(elite_size, population, key=lambda x: x.fitness)
 
-def crossover(parent1, parent2):
+def tournament_selection(population, tournament_size=TOURNAMENT_SIZE):
+    # Pick the fittest of a few randomly drawn schedules
+    contenders = random.sample(population, min(tournament_size, len(population)))
+    return max(contenders, key=lambda x: x.fitness)
+
+def crossover(parent1, parent2, evaluate=True):
     child = Schedule()
     for time_slot in TIME_SLOTS:
         # Decide whether to copy lessons from parent1 or parent2
@@ -315,18 +476,18 @@ def crossover(parent1, parent2):
         # Copy lessons for even week
         for lesson in source_lessons_even:
             if not is_conflict(lesson, time_slot, child.even_timetable):
-                child.even_timetable[time_slot].append(copy.deepcopy(lesson))
+                child.even_timetable[time_slot].append(lesson.copy())
         # Copy lessons for odd week
         for lesson in source_lessons_odd:
             if not is_conflict(lesson, time_slot, child.odd_timetable):
-                child.odd_timetable[time_slot].append(copy.deepcopy(lesson))
-    # Calculate fitness after crossover
-    child.calculate_fitness()
+                child.odd_timetable[time_slot].append(lesson.copy())
+    # Calculate fitness after crossover (the GA scores its children in one batch instead)
+    if evaluate:
+        child.calculate_fitness()
     return child
 
-def mutate(schedule):
+def mutate(schedule, mutation_rate=MUTATION_RATE, evaluate=True):
     # Randomly change some lessons in the schedule
-    mutation_rate = 0.1  # 10% chance of mutation
     for week in ['even', 'odd']:
         timetable = schedule.even_timetable if week == 'even' else schedule.odd_timetable
         opposite_timetable = schedule.odd_timetable if week == 'even' else schedule.even_timetable
@@ -352,7 +513,8 @@ def mutate(schedule):
                             lesson.time_slot = new_time_slot
                             timetable[new_time_slot].append(lesson)
     # Calculate fitness after mutation
-    schedule.calculate_fitness()
+    if evaluate:
+        schedule.calculate_fitness()
 
 def transfer_lesson_between_weeks(from_timetable, to_timetable):
     # Choose a random time slot and lesson
@@ -375,36 +537,16 @@ def transfer_lesson_between_weeks(from_timetable, to_timetable):
 def add_random_lesson(timetable):
     # Choose a random subject
     subject = random.choice(subjects)
-    group = next((g for g in groups if g.number == subject.group_id), None)
-    if not group:
-        return
     # Choose a random lesson type
     lesson_type = random.choice(['Лекція', 'Практика'])
-    lessons_to_add = []
-    if lesson_type == 'Практика' and subject.requires_subgroups and group.subgroups:
-        for subgroup in group.subgroups:
-            lesson = Lesson(subject, lesson_type, group, subgroup)
-            lessons_to_add.append(lesson)
-    else:
-        lesson = Lesson(subject, lesson_type, group)
-        lessons_to_add.append(lesson)
+    variants = instance.lesson_variants.get((subject.id, lesson_type))
+    if not variants:
+        return
+    lessons_to_add = instance.new_lessons(variants)
     # Assign lecturer and auditorium
     for lesson in lessons_to_add:
-        possible_lecturers = get_possible_lecturers(lesson)
-        if not possible_lecturers:
-            return
-        lecturer = random.choice(possible_lecturers)
-        lesson.lecturer = lecturer
-        if lesson.subgroup:
-            students = group.size // len(group.subgroups)
-            suitable_auditoriums = [aud for aud in auditoriums if aud.capacity >= students]
-        else:
-            students = group.size
-            suitable_auditoriums = [aud for aud in auditoriums if aud.capacity >= students]
-        if not suitable_auditoriums:
+        if not instance.assign_resources(lesson):
             return
-        auditorium = random.choice(suitable_auditoriums)
-        lesson.auditorium = auditorium
     # Assign time slot
     available_time_slots = TIME_SLOTS.copy()
     random.shuffle(available_time_slots)
@@ -417,7 +559,7 @@ def add_random_lesson(timetable):
         if not conflict:
             for lesson in lessons_to_add:
                 lesson.time_slot = time_slot
-                timetable[time_slot].append(copy.deepcopy(lesson))
+                timetable[time_slot].append(lesson)
             break
 
 def remove_random_lesson(timetable):
@@ -441,29 +583,202 @@ def remove_random_lesson(timetable):
     for lesson in lessons_to_remove:
         timetable[lesson.time_slot].remove(lesson)
 
-def genetic_algorithm():
-    population = create_initial_population()
-    for generation in range(GENERATIONS):
-        selected = selection(population)
+def _day_gaps(periods):
+    # Idle periods between the lessons of one day, as counted by the evaluator
+    periods = sorted(periods)
+    return sum(max(0, later - earlier - 1) for earlier, later in zip(periods, periods[1:]))
+
+def _move_delta(day_periods, from_day, from_period, to_day, to_period):
+    # Change of the gap penalty of one group or lecturer when a lesson moves between slots of the same week
+    from_periods = day_periods[from_day]
+    before = _day_gaps(from_periods)
+    remaining = list(from_periods)
+    remaining.remove(from_period)
+    if from_day == to_day:
+        return _day_gaps(remaining + [to_period]) - before
+    to_periods = day_periods[to_day]
+    before += _day_gaps(to_periods)
+    return _day_gaps(remaining) + _day_gaps(to_periods + [to_period]) - before
+
+def _lesson_units(lesson):
+    # Evaluator units (subgroups, or the whole group) whose gaps the lesson affects
+    return instance.evaluator.units.get((lesson.group.number, lesson.subgroup), [])
+
+def local_search(schedule, max_moves=MEMETIC_MOVES):
+    # Bounded hill-climb: move a lesson to the non-conflicting slot of the same week that lowers
+    # the gap penalty the most. Only the days a move touches are re-scored, and the full fitness
+    # is recalculated once at the end. Returns the number of moves made.
+    moves = 0
+    for timetable in (schedule.even_timetable, schedule.odd_timetable):
+        # Evaluator group unit / lecturer.id -> day -> periods
+        group_days = defaultdict(lambda: defaultdict(list))
+        lecturer_days = defaultdict(lambda: defaultdict(list))
+        lessons = []
+        for (day, period), slot_lessons in timetable.items():
+            for lesson in slot_lessons:
+                lessons.append(lesson)
+                for unit in _lesson_units(lesson):
+                    group_days[unit][day].append(int(period))
+                if lesson.lecturer:
+                    lecturer_days[lesson.lecturer.id][day].append(int(period))
+        random.shuffle(lessons)
+        for lesson in lessons:
+            if moves >= max_moves:
+                break
+            from_day, from_period = lesson.time_slot
+            from_period = int(from_period)
+            best_slot = None
+            best_delta = 0
+            for time_slot in TIME_SLOTS:
+                if time_slot == lesson.time_slot:
+                    continue
+                to_day, to_period = time_slot[0], int(time_slot[1])
+                delta = 0
+                for unit in _lesson_units(lesson):
+                    delta += _move_delta(group_days[unit], from_day, from_period, to_day, to_period)
+                if lesson.lecturer:
+                    delta += _move_delta(lecturer_days[lesson.lecturer.id],
+                                         from_day, from_period, to_day, to_period)
+                if delta < best_delta and not is_conflict(lesson, time_slot, timetable):
+                    best_slot = time_slot
+                    best_delta = delta
+            if not best_slot:
+                continue
+            to_day, to_period = best_slot[0], int(best_slot[1])
+            for unit in _lesson_units(lesson):
+                group_days[unit][from_day].remove(from_period)
+                group_days[unit][to_day].append(to_period)
+            if lesson.lecturer:
+                lecturer_periods = lecturer_days[lesson.lecturer.id]
+                lecturer_periods[from_day].remove(from_period)
+                lecturer_periods[to_day].append(to_period)
+            timetable[lesson.time_slot].remove(lesson)
+            lesson.time_slot = best_slot
+            timetable[best_slot].append(lesson)
+            moves += 1
+    if moves:
+        schedule.calculate_fitness()
+    return moves
+
+def genome_signature(schedule):
+    # Placement of every lesson; equal signatures mean identical schedules
+    placements = []
+    for week, timetable in (('even', schedule.even_timetable), ('odd', schedule.odd_timetable)):
+        for time_slot, lessons in timetable.items():
+            for lesson in lessons:
+                placements.append((
+                    week, time_slot, lesson.subject.id, lesson.type, lesson.group.number, lesson.subgroup,
+                    lesson.lecturer.id if lesson.lecturer else None,
+                    lesson.auditorium.id if lesson.auditorium else None
+                ))
+    return frozenset(placements)
+
+def population_diversity(population):
+    # Share of distinct schedules in the population: 1.0 - all different, 1/len - all identical
+    return len(set(genome_signature(schedule) for schedule in population)) / len(population)
+
+def adaptive_mutation_rate(diversity):
+    # The less diverse the population, the more it is mutated
+    return MUTATION_RATE + (MAX_MUTATION_RATE - MUTATION_RATE) * (1 - diversity)
+
+def is_stagnant(best_history):
+    # Best fitness has not improved over the last STAGNATION_WINDOW generations
+    if len(best_history) <= STAGNATION_WINDOW:
+        return False
+    return best_history[-1] - best_history[-1 - STAGNATION_WINDOW] <= STAGNATION_TOLERANCE
+
+def save_checkpoint(path, generation, population, best_history):
+    state = {
+        'generation': generation,
+        'population': population,
+        'best_history': best_history,
+        'random_state': random.getstate()
+    }
+    # Write to a temporary file first so an interrupted save never corrupts the previous checkpoint
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(state, f)
+    os.replace(tmp_path, path)
+
+def load_checkpoint(path):
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+def genetic_algorithm(checkpoint_path=None, resume=False, seed_rate=SEED_RATE, memetic=False,
+                      on_generation=None, memory=None):
+    # on_generation(generation, best_fitness) is called after every generation, e.g. to report progress.
+    # memory - optional profiling.MemoryProfile with a budget: the initial population is cut short
+    # (see create_initial_population); while over it the population is halved down to
+    # MIN_POPULATION_SIZE, after that evolution stops with the best schedule found so far.
+    # Memory freed by a smaller population mostly stays with the process, so after a reduction
+    # the budget only counts as exceeded again once the resident size grows past its level then
+    # by more than REDUCED_RSS_MARGIN of the budget
+    global generations_run
+    start_generation = 0
+    best_history = []
+    if checkpoint_path and resume and os.path.exists(checkpoint_path):
+        state = load_checkpoint(checkpoint_path)
+        population = state['population']
+        start_generation = state['generation']
+        best_history = state['best_history']
+        random.setstate(state['random_state'])
+        print(f'Resumed from checkpoint {checkpoint_path} at generation {start_generation}.')
+    else:
+        population = create_initial_population(seed_rate, memory)
+    elite_size = max(1, int(ELITE_RATE * POPULATION_SIZE))
+    population_size = min(POPULATION_SIZE, len(population))
+    reduced_rss = None  # Resident size right after the last reduction of the population
+    for generation in range(start_generation, GENERATIONS):
+        mutation_rate = adaptive_mutation_rate(population_diversity(population))
         new_population = []
-        # Elitism: retain top 10% individuals without changes
-        elite_size = max(1, int(0.1 * POPULATION_SIZE))
-        elites = selected[:elite_size]
-        new_population.extend(copy.deepcopy(elites))
-        # Random crossover and mutation for the rest
-        while len(new_population) < POPULATION_SIZE:
-            parent1, parent2 = random.sample(selected, 2)
-            child = crossover(parent1, parent2)
-            mutate(child)
-            new_population.append(child)
+        # Elitism: retain the best individuals without changes.
+        # Elites are never mutated in place, so they are shared rather than copied;
+        # crossover copies their lessons only when a child is derived from them.
+        new_population.extend(select_elites(population, elite_size))
+        # Tournament selection, crossover and mutation for the rest
+        children = []
+        while len(new_population) + len(children) < population_size:
+            parent1 = tournament_selection(population)
+            parent2 = tournament_selection(population)
+            child = crossover(parent1, parent2, evaluate=False)
+            mutate(child, mutation_rate, evaluate=False)
+            children.append(child)
+        evaluate_schedules(children)
+        # Memetic step: polish the best offspring (elites stay shared and untouched)
+        if memetic:
+            for child in select_elites(children, MEMETIC_TOP):
+                local_search(child)
+        new_population.extend(children)
         population = new_population
         best_fitness = max(schedule.fitness for schedule in population)
+        best_history.append(best_fitness)
+        if on_generation:
+            on_generation(generation + 1, best_fitness)
         if (generation + 1) % 10 == 0 or best_fitness == 1.0:
-            print(f'Generation {generation + 1}: Best Fitness = {best_fitness}\n')
+            print(f'Generation {generation + 1}: Best Fitness = {best_fitness}, Mutation rate = {mutation_rate:.2f}\n')
+        if checkpoint_path and (generation + 1) % CHECKPOINT_INTERVAL == 0:
+            save_checkpoint(checkpoint_path, generation + 1, population, best_history)
         if best_fitness == 1.0:
             print(f'Optimal schedule found at generation {generation + 1}.')
             break
+        if is_stagnant(best_history):
+            print(f'Best fitness has not improved for {STAGNATION_WINDOW} generations, '
+                  f'stopping at generation {generation + 1}.')
+            break
+        if memory and memory.over_budget():
+            if reduced_rss is not None and \
+                    profiling.current_rss_mb() <= reduced_rss + REDUCED_RSS_MARGIN * memory.budget_mb:
+                continue  # Still the memory of the larger population, not new growth
+            if population_size <= MIN_POPULATION_SIZE:
+                print(f'Memory budget exceeded, stopping at generation {generation + 1}.')
+                break
+            population_size = max(MIN_POPULATION_SIZE, population_size // 2)
+            population = select_elites(population, population_size)
+            reduced_rss = profiling.current_rss_mb()
+            print(f'Memory budget exceeded, population reduced to {population_size}.')
+    generations_run = len(best_history)
     best_schedule = max(population, key=lambda x: x.fitness)
+    print(f'Fitness evaluations: {fitness_evaluations}')
     return best_schedule
 
 def print_schedule(schedule):
@@ -530,7 +845,48 @@ def print_schedule(schedule):
         print("No lessons scheduled for ODD week.\n")
 
 if __name__ == "__main__":
-    # Run the genetic algorithm and get the best schedule
-    best_schedule = genetic_algorithm()
-    # Print the final schedule to the console
-    print_schedule(best_schedule)
+    parser = argparse.ArgumentParser(description='Genetic algorithm timetable scheduler')
+    parser.add_argument('--data-dir', default=DATA_DIR, help='directory with the input CSV files')
+    parser.add_argument('--checkpoint', help='file to save the population to every CHECKPOINT_INTERVAL generations')
+    parser.add_argument('--resume', action='store_true', help='continue from --checkpoint if it exists')
+    parser.add_argument('--seed-rate', type=float, default=SEED_RATE,
+                        help='share of the initial population built by the greedy constructor (0 - all random)')
+    parser.add_argument('--memetic', action='store_true',
+                        help='improve the best offspring of every generation by local search')
+    export.add_arguments(parser)
+    profiling.add_arguments(parser)
+    args = parser.parse_args()
+    export.check_arguments(parser, args)
+    # Optional per-phase memory profile and memory budget (--profile-memory, --memory-budget)
+    profile = profiling.from_args(args)
+    # Everything printed before the export - loading, progress, the summary - goes to stderr
+    # when the schedule itself is streamed to stdout
+    progress = sys.stderr if args.export and args.output == '-' else sys.stdout
+    with contextlib.redirect_stdout(progress):
+        with profile.phase('load'):
+            data = read_data(args.data_dir)
+        with profile.phase('domain build'):
+            use_data(data)  # Compiles the lesson templates and the eligible lecturers and auditoriums
+        # Run the genetic algorithm and get the best schedule
+        try:
+            with profile.phase('evolution'):
+                best_schedule = genetic_algorithm(checkpoint_path=args.checkpoint, resume=args.resume,
+                                                  seed_rate=args.seed_rate, memetic=args.memetic, memory=profile)
+        except profiling.MemoryBudgetExceeded as e:
+            # Not even MIN_POPULATION_SIZE schedules fit into the budget
+            print(f"Stopped: {e}", file=sys.stderr)
+            profile.report()
+            sys.exit(3)
+        with profile.phase('evaluation'):
+            metrics = instance.evaluator.evaluate(evaluation.placements_from_schedule(best_schedule))
+        print(f"Best schedule: fitness {best_schedule.fitness:.4f}, windows {metrics['windows']}, "
+              f"conflicts {metrics['conflicts']}, lecturer overload {metrics['lecturer_overload']}")
+    with profile.phase('render'):
+        if args.export:
+            # Stream the final schedule instead of printing the tables
+            export.export(export.placements_from_schedule(best_schedule, TIME_SLOTS),
+                          args.export, args.output, args.view, args.term_start)
+        else:
+            # Print the final schedule to the console
+            print_schedule(best_schedule)
+    profile.report()